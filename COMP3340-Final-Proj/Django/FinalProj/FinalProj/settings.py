@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,7 +53,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware', # first, so it times everything below it. Server-Timing header + /metrics/
+    'core.middleware.ReplicaStickinessMiddleware', # read-your-writes for the read replicas, see core/routers.py
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.PageCacheMiddleware', # whole pages for anonymous visitors, see core/page_cache.py
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -63,9 +67,15 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'FinalProj.urls'
 
+SLOW_REQUEST_MS = 500 # requests slower than this are logged with their duplicate queries
+# Who may scrape /metrics/ besides logged in staff: these addresses, and requests with an
+# "Authorization: Bearer <METRICS_TOKEN>" header. Nobody else by default.
+METRICS_ALLOWED_IPS = []
+METRICS_TOKEN = ''
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates', # Django's, timed for Server-Timing (core/middleware.py)
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -96,6 +106,47 @@ DATABASES = {
         }
 }
 
+# Read replicas for the catalog pages, one alias per host in DATABASE_REPLICA_HOSTS (comma separated).
+# The routing is in core/routers.py.
+for i, host in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{i}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+
+# DJANGO_SQLITE_REPLICA=1 runs on two local SQLite files instead, a primary and a "replica" that is only
+# updated when you copy the primary over it (cp db.sqlite3 db-replica.sqlite3), so replica lag is easy to see
+if os.environ.get('DJANGO_SQLITE_REPLICA'):
+    DATABASES = {
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'},
+        'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db-replica.sqlite3', 'TEST': {'MIRROR': 'default'}},
+    }
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKY_SECONDS = 10 # reads stay on the primary this long after a visitor changed something
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The catalog fragment cache (item/cache.py) works with the local-memory or the file based backend
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'takcomputers',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+CATALOG_CACHE_TIMEOUT = 600 # seconds, old entries are never served anyway since the keys are versioned
+PAGE_CACHE_TIMEOUT = 600 # anonymous full-page cache, entries are purged by tag when the catalog changes
+PAGE_CACHE_PROXY_SECONDS = 30 # s-maxage for a reverse proxy, which can't be purged
+SUGGEST_MAX_ENTRIES = 50000 # names (and words in them) held by each process's autocomplete index
+SUGGEST_INDEX_MAX_AGE = 300 # seconds before a process rebuilds it, to pick up changes made by the others
+
+# Sessions are read from the cache and written through to the database, only when they changed (core/sessions.py)
+SESSION_ENGINE = 'core.sessions'
+SESSION_CACHE_SECONDS = 60 # how long a process keeps its copy of an anonymous session with the local-memory cache
+SESSION_CLEAR_BATCH_SIZE = 1000 # expired sessions deleted per query by `manage.py clearsessions`
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -136,6 +187,20 @@ MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
+# Uploads are stored once per content under media/blobs/, see core/storage.py
+STORAGES = {
+    'default': {'BACKEND': 'core.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+BLOB_CACHE_SECONDS = 365 * 24 * 3600 # blobs never change, browsers can keep them for good
+BLOB_DELETE_GRACE = 60 # seconds, an unused blob written more recently than this is deleted later (core/blobs.py)
+
+# Database job queue, run by `manage.py runworker` (see core/jobs.py)
+JOB_RETRY_DELAY = 10 # seconds before the first retry of a failed job, doubled every attempt
+JOB_TIMEOUT = 600 # a job running longer than this is assumed to have lost its worker and is run again
+JOB_POLL_SECONDS = 1 # how often an idle worker looks for new jobs
+JOB_KEEP_DAYS = 7 # finished jobs are deleted after this long, failed ones are kept
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
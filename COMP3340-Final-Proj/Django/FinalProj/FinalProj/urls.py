@@ -18,14 +18,20 @@ Including another URLconf
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 
 # Importing the views we created
-from core.views import index, contact
+from core.storage import BLOB_DIR
+from core.views import blob, index, contact
 
 urlpatterns = [
     path('', include('core.urls')), # this will loop through all of the paths of urls.py first before the paths below
     path('items/', include('item.urls')), # imports that additional `urls.py` file we created in the `.item` folder
     path('dashboard/', include('dashboard.urls')),
     path('admin/', admin.site.urls),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.DEBUG:
+    # Uploaded blobs are immutable and get a far-future Cache-Control, see core.views.blob
+    urlpatterns.append(re_path(r'^%s%s/(?P<path>.*)$' % (settings.MEDIA_URL.lstrip('/'), BLOB_DIR), blob))
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,4 +1,10 @@
 from django.contrib import admin
-from .models import Profile
+from .models import Job, Profile
 
 admin.site.register(Profile)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'status', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'task')
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from .blobs import track
+        from .models import Profile
+
+        track(Profile, 'image') # reference counts of the uploaded files, see core/blobs.py
@@ -0,0 +1,185 @@
+import posixpath
+import threading
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from item.thumbnails import THUMBNAIL_SIZES, thumbnail_name
+
+from .jobs import enqueue
+from .models import Blob
+from .storage import BLOB_DIR, is_blob
+
+# Reference counts of the blobs in the content-addressed storage (core/storage.py): core.models.Blob has one row
+# per stored file with how many rows of the tracked file fields point at it. A blob that nobody references
+# any more can be deleted.
+# The counts follow the signals of the tracked models, like the category counters in item/counters.py, and
+# reconcile_blob_references() recounts them after bulk changes that skip the signals.
+#
+# A file that a row stops using (the row was deleted, or its file replaced) is deleted once the transaction
+# commits: delete_later() collects the names, and after the commit one background job (core/jobs.py) deletes
+# those that no row uses any more, with their thumbnails. A rollback keeps the files. `manage.py reclaim_media`
+# finds the files left behind before this existed, or by anything that skipped the signals.
+
+TRACKED = [] # (model, field name), see track()
+
+# Media the templates link to by path (logo, about/contact pictures, default profile picture).
+# They are not uploads, so they are never moved into the blob storage or deleted.
+PINNED_MEDIA = {
+    'item_images/TAK-logos_black.png',
+    'item_images/windsor.jpg',
+    'item_images/cropped_prof_pic.png',
+    'item_images/AleksPic.png',
+    'item_images/KellenPic.png',
+    'Profile_Images/DefaultProfPic.jpg',
+}
+
+
+def retain(name):
+    if not is_blob(name):
+        return
+    if not Blob.objects.filter(name=name).update(references=F('references') + 1):
+        blob, created = Blob.objects.get_or_create(name=name, defaults={'references': 1})
+        if not created: # created by someone else in the meantime
+            Blob.objects.filter(name=name).update(references=F('references') + 1)
+
+
+def release(name):
+    if is_blob(name):
+        Blob.objects.filter(name=name).update(references=Greatest(F('references') - 1, Value(0)))
+
+
+def track(model, field_name):
+    # Called from AppConfig.ready() for every file field stored in the blob storage
+    TRACKED.append((model, field_name))
+    attname = model._meta.get_field(field_name).attname
+
+    def remember(sender, instance, **kwargs):
+        # The name the row had when it was loaded, so a replaced file can be released
+        instance.__dict__.setdefault('_loaded_files', {})[attname] = _name(instance.__dict__.get(attname))
+
+    def saved(sender, instance, **kwargs):
+        old = instance.__dict__.get('_loaded_files', {}).get(attname)
+        new = _name(getattr(instance, attname))
+        if old != new:
+            retain(new)
+            release(old)
+            delete_later(old)
+        remember(sender, instance)
+
+    def deleted(sender, instance, **kwargs):
+        name = _name(getattr(instance, attname))
+        release(name)
+        delete_later(name)
+
+    uid = f'blob:{model._meta.label}.{field_name}'
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=uid)
+
+
+def _name(value):
+    return getattr(value, 'name', value) or None
+
+
+def reconcile_blob_references():
+    # Recounts every blob from the tracked fields, returns how many blobs there are
+    counts = {}
+    for model, field_name in TRACKED:
+        rows = model._base_manager.filter(**{f'{field_name}__startswith': BLOB_DIR + '/'}).order_by()
+        for name, n in rows.values_list(field_name).annotate(n=Count('pk')):
+            counts[name] = counts.get(name, 0) + n
+
+    Blob.objects.bulk_create([Blob(name=name) for name in counts], ignore_conflicts=True, batch_size=1000)
+    for name, references in Blob.objects.values_list('name', 'references').iterator():
+        if counts.get(name, 0) != references: # only the ones that drifted are written
+            Blob.objects.filter(name=name).update(references=counts.get(name, 0))
+    return len(counts)
+
+
+_pending = threading.local() # the names delete_later() collected in this thread's transaction
+
+
+def delete_grace():
+    return getattr(settings, 'BLOB_DELETE_GRACE', 60) # a blob written this recently may be a new upload of the same content
+
+
+def delete_later(name):
+    if not name or name in PINNED_MEDIA:
+        return
+    if not hasattr(_pending, 'names'):
+        _pending.names = set()
+    _pending.names.add(name)
+    # Registered for every name, the first callback after the commit takes them all. Names left over by a
+    # rollback go with the next commit, delete_unused_files() checks them again anyway.
+    transaction.on_commit(_enqueue_pending)
+
+
+def _enqueue_pending():
+    names = _pending.__dict__.pop('names', None)
+    if names:
+        enqueue(delete_unused_files, *sorted(names))
+
+
+def referenced_names(names):
+    # The names that a tracked row uses, or that are pinned
+    names = list(names)
+    used = {name for name in names if name in PINNED_MEDIA}
+    for start in range(0, len(names), 500):
+        chunk = names[start:start + 500]
+        for model, field_name in TRACKED:
+            used.update(model._base_manager.filter(**{f'{field_name}__in': chunk}).values_list(field_name, flat=True))
+    return used
+
+
+def referenced_stems(stems):
+    # Of the 'directory/stem' names, the ones some used file has (as directory/stem.<anything>).
+    # Thumbnails are named by the stem only, so cpu.jpg and cpu.png share them.
+    stems = list(stems)
+    used = set()
+    for start in range(0, len(stems), 100):
+        chunk = stems[start:start + 100]
+        for model, field_name in TRACKED:
+            query = reduce(or_, [Q(**{f'{field_name}__startswith': stem + '.'}) for stem in chunk])
+            used.update(stem_of(name) for name in model._base_manager.filter(query).values_list(field_name, flat=True))
+    used.update(stem_of(name) for name in PINNED_MEDIA)
+    return used & set(stems)
+
+
+def _modified_recently(name):
+    try:
+        return default_storage.get_modified_time(name) > timezone.now() - timedelta(seconds=delete_grace())
+    except FileNotFoundError:
+        return False
+
+
+def stem_of(name):
+    return posixpath.splitext(name)[0]
+
+
+def delete_unused_files(*names):
+    # Background job enqueued by delete_later(): deletes the files (and their thumbnails) no row uses
+    unused = set(names) - referenced_names(names)
+    # The same content may have been uploaded again a moment ago, and its row not committed yet
+    recent = {name for name in unused if is_blob(name) and _modified_recently(name)}
+    if recent:
+        enqueue(delete_unused_files, *sorted(recent), delay=delete_grace())
+    unused -= recent
+    if not unused:
+        return
+    Blob.objects.filter(name__in=unused).delete()
+    used_stems = referenced_stems({stem_of(name) for name in unused})
+    for name in sorted(unused):
+        files = [name]
+        if stem_of(name) not in used_stems:
+            files += [thumbnail_name(name, size) for size in THUMBNAIL_SIZES]
+        for file in files:
+            default_storage.delete(file) # does nothing if it's gone already
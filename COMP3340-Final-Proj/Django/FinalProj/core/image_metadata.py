@@ -0,0 +1,41 @@
+import base64
+import logging
+from io import BytesIO
+
+from PIL import Image, ImageFilter, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# What the templates need to lay out an image before it has downloaded: its size (for the width/height
+# attributes, so the page doesn't jump around when it arrives) and a tiny blurred preview shown in its place
+# (a data: URI of a few hundred bytes). Read once when the file is uploaded (Images.save(), Profile.save()),
+# `manage.py capture_image_metadata` fills it in for older uploads.
+
+PLACEHOLDER_SIDE = 16 # pixels, the browser scales it up and it's blurry anyway
+PLACEHOLDER_QUALITY = 40
+
+
+def image_metadata(file):
+    # {'width', 'height', 'size', 'format', 'placeholder'} of an uploaded or stored file, None if it isn't an image
+    try:
+        file.seek(0)
+        image = Image.open(file)
+        image.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning("Could not read image metadata of %s", getattr(file, 'name', file), exc_info=True)
+        return None
+    finally:
+        file.seek(0) # for whoever reads the upload next (the storage)
+
+    preview = image.convert('RGB')
+    preview.thumbnail((PLACEHOLDER_SIDE, PLACEHOLDER_SIDE))
+    buffer = BytesIO()
+    preview.filter(ImageFilter.GaussianBlur(1)).save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+
+    return {
+        'width': image.width,
+        'height': image.height,
+        'size': file.size,
+        'format': (image.format or '').lower(),
+        'placeholder': 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode(),
+    }
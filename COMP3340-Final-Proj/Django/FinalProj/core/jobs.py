@@ -0,0 +1,148 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import routers
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# A small job queue kept in the project's own database, for work that doesn't have to happen inside the
+# request (e.g. the thumbnails of a new upload, item/thumbnails.py). `manage.py runworker` runs the jobs.
+#
+#   enqueue(make_thumbnails, image.pk, dedupe_key=f'thumbnails:{image.pk}')
+#
+# A job is a function and JSON arguments. With a dedupe_key, enqueueing a job that is already waiting
+# returns the waiting one. A job that raises is retried with exponential backoff (JOB_RETRY_DELAY seconds,
+# doubled every attempt) until max_attempts, then it is kept as failed with its traceback.
+# Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can poll the same table
+# without handing out a job twice. SQLite has no row locks, there a job is claimed with a conditional
+# UPDATE (queued -> running) and whoever changed the row owns it.
+# Jobs are enqueued inside the caller's transaction, so they only become visible once it commits.
+
+
+def retry_delay():
+    return getattr(settings, 'JOB_RETRY_DELAY', 10)
+
+
+def job_timeout():
+    return getattr(settings, 'JOB_TIMEOUT', 600) # a running job older than this lost its worker and is run again
+
+
+def task_name(task):
+    return task if isinstance(task, str) else f'{task.__module__}.{task.__qualname__}'
+
+
+def enqueue(task, *args, dedupe_key=None, delay=0, max_attempts=5, **kwargs):
+    job = Job(
+        task=task_name(task), args=list(args), kwargs=kwargs, dedupe_key=dedupe_key,
+        run_at=timezone.now() + timedelta(seconds=delay), max_attempts=max_attempts,
+    )
+    if dedupe_key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError: # the same job is already waiting
+        return Job.objects.filter(dedupe_key=dedupe_key, status=Job.QUEUED).first() or enqueue(
+            task, *args, dedupe_key=dedupe_key, delay=delay, max_attempts=max_attempts, **kwargs
+        )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker, limit=1):
+    # Marks up to `limit` due jobs as running for this worker and returns them
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    changes = {'status': Job.RUNNING, 'locked_at': now, 'locked_by': worker, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**changes)
+    else:
+        ids = []
+        for pk in due.values_list('id', flat=True)[:limit * 4]: # a few more, other workers may take some of them
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(**changes):
+                ids.append(pk)
+                if len(ids) >= limit:
+                    break
+    return list(Job.objects.filter(id__in=ids).order_by('run_at', 'id'))
+
+
+def run(job):
+    token = routers.start_request(pinned=True) # a job usually follows a write, a replica may not have it yet
+    try:
+        import_string(job.task)(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception('Job %s (%s) failed, attempt %d of %d', job.pk, job.task, job.attempts, job.max_attempts)
+        failed(job, traceback.format_exc())
+        return False
+    finally:
+        routers.end_request(token)
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now(), last_error='')
+    return True
+
+
+def failed(job, error):
+    if job.attempts >= job.max_attempts:
+        Job.objects.filter(pk=job.pk).update(status=Job.FAILED, finished_at=timezone.now(), last_error=error)
+        return
+    run_at = timezone.now() + timedelta(seconds=retry_delay() * 2 ** (job.attempts - 1))
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(status=Job.QUEUED, run_at=run_at, locked_at=None, locked_by='', last_error=error)
+    except IntegrityError: # the same job was enqueued again meanwhile, that one will do it
+        Job.objects.filter(pk=job.pk).update(status=Job.DONE, finished_at=timezone.now(), last_error=error)
+
+
+def requeue_stale():
+    # Jobs whose worker died while running them; the attempt still counts
+    cutoff = timezone.now() - timedelta(seconds=job_timeout())
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    for job in stale:
+        failed(job, f'Worker {job.locked_by} did not finish it within {job_timeout()}s')
+    return len(stale)
+
+
+def delete_finished(days=None):
+    days = getattr(settings, 'JOB_KEEP_DAYS', 7) if days is None else days
+    return Job.objects.filter(status=Job.DONE, finished_at__lt=timezone.now() - timedelta(days=days)).delete()[0]
+
+
+def work(worker=None, batch=10, once=False, should_stop=lambda: False, sleep=None):
+    # Runs jobs until should_stop() (or, with once=True, until none are due). Returns how many ran.
+    worker = worker or worker_name()
+    ran = 0
+    requeue_stale()
+    idle_since_housekeeping = 0
+    while not should_stop():
+        jobs = claim(worker, batch)
+        for job in jobs:
+            run(job)
+            ran += 1
+        if jobs:
+            continue
+        if once:
+            break
+        idle_since_housekeeping += 1
+        if idle_since_housekeeping >= 60:
+            requeue_stale()
+            delete_finished()
+            idle_since_housekeeping = 0
+        time.sleep(sleep if sleep is not None else getattr(settings, 'JOB_POLL_SECONDS', 1))
+    return ran
@@ -0,0 +1,200 @@
+import itertools
+import json
+import math
+import random
+import subprocess
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from dashboard.models import CartLine
+from item.models import Category, Item
+
+SCENARIOS = [
+    'index', 'browse', 'browse_search', 'browse_ajax', 'detail',
+    'dashboard', 'cart', 'cart_update', 'export_csv',
+]
+SEARCH_TERMS = ['ryzen', 'geforce', 'radeon', 'core', 'noctua', 'quiet', 'rgb']
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Requests the main pages through the Django test client against the current database (see seed_catalog) '
+        'and prints p50/p95/p99 latency, throughput and queries per request as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run, all of them by default: {", ".join(SCENARIOS)}')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--export-requests', type=int, default=3, help='Requests for export_csv, which reads every item')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests before each scenario')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request')
+        parser.add_argument('--customer', help='Username used for the cart scenarios (default: a customer with a cart)')
+        parser.add_argument('--manager', help='Username used for the dashboard/export scenarios (default: the manager with the most items)')
+        parser.add_argument('--seed', type=int, default=3340)
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.item_ids = list(Item.objects.filter(is_sold=False).values_list('id', flat=True)[:5000])
+        self.category_ids = list(Category.objects.values_list('id', flat=True))
+        if not self.item_ids:
+            raise CommandError('There are no items to request, run "manage.py seed_catalog" first')
+
+        self.customer = self.find_customer(options['customer'])
+        self.manager = self.find_manager(options['manager'])
+        self.cart_item_ids = list(CartLine.objects.filter(cart__user=self.customer).values_list('item_id', flat=True))
+
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenario(s): {", ".join(sorted(unknown))}')
+
+        report = {
+            'commit': current_commit(),
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'items': Item.objects.count(),
+            'categories': len(self.category_ids),
+            'cold_cache': options['cold'],
+            'scenarios': {},
+        }
+        for name in options['scenarios'] or SCENARIOS:
+            count = options['export_requests'] if name == 'export_csv' else options['requests']
+            report['scenarios'][name] = self.run_scenario(name, count, options['warmup'], options['cold'])
+            self.stderr.write(f"{name}: p95 {report['scenarios'][name]['p95_ms']} ms")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def find_customer(self, username):
+        User = get_user_model()
+        if username:
+            return User.objects.get(username=username)
+        customer = User.objects.filter(is_customer=True, cart__lines__isnull=False).first()
+        if customer is None:
+            raise CommandError('No customer has a cart, pass --customer')
+        return customer
+
+    def find_manager(self, username):
+        User = get_user_model()
+        if username:
+            return User.objects.get(username=username)
+        manager = User.objects.filter(is_inventoryManager=True).annotate(n=Count('items')).order_by('-n').first()
+        if manager is None:
+            raise CommandError('There is no inventory manager, pass --manager')
+        return manager
+
+    def client(self, user=None):
+        # DEBUG=True allows localhost even with an empty ALLOWED_HOSTS
+        hosts = [host for host in settings.ALLOWED_HOSTS if host not in ('*', '') and not host.startswith('.')]
+        client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+        if user is not None:
+            client.force_login(user)
+        return client
+
+    # Each scenario returns a function making one request: (client, function)
+    def scenario(self, name):
+        rng = self.rng
+        if name == 'index':
+            return self.client(), lambda c: c.get(reverse('core:index'))
+        if name == 'browse':
+            return self.client(), lambda c: c.get(reverse('item:browse'))
+        if name == 'browse_search':
+            return self.client(), lambda c: c.get(reverse('item:browse'), {'query': rng.choice(SEARCH_TERMS)})
+        if name == 'browse_ajax':
+            return self.client(), lambda c: c.get(
+                reverse('item:browse'), {'category': rng.choice(self.category_ids)}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        if name == 'detail':
+            return self.client(), lambda c: c.get(reverse('item:detail', args=[rng.choice(self.item_ids)]))
+        if name == 'dashboard':
+            return self.client(self.manager), lambda c: c.get(reverse('dashboard:index'))
+        if name == 'cart':
+            return self.client(self.customer), lambda c: c.get(reverse('dashboard:cart'))
+        if name == 'cart_update':
+            if not self.cart_item_ids:
+                raise CommandError(f'{self.customer} has an empty cart')
+            # Every cart line is increased and then decreased again, so the quantities stay where they were
+            steps = itertools.count()
+
+            def update(c):
+                step = next(steps)
+                item_id = self.cart_item_ids[step // 2 % len(self.cart_item_ids)]
+                view = 'dashboard:increase_quantity' if step % 2 == 0 else 'dashboard:decrease_quantity'
+                return c.get(reverse(view, args=[item_id]))
+            return self.client(self.customer), update
+        if name == 'export_csv':
+            return self.client(self.manager), lambda c: c.get(reverse('item:export_items_to_csv'))
+
+    def request(self, client, make_request):
+        # The queries are counted on every database, reads may go to a replica (core/routers.py)
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(db)) for db in connections.all()]
+            start = time.perf_counter()
+            response = make_request(client)
+            if response.streaming:
+                for _ in response.streaming_content: # the export only does its work while it is read
+                    pass
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, sum(len(queries) for queries in captured)
+
+    def run_scenario(self, name, count, warmup, cold):
+        client, make_request = self.scenario(name)
+        for _ in range(warmup):
+            self.request(client, make_request)
+
+        durations, query_counts, statuses = [], [], {}
+        started = time.perf_counter()
+        for _ in range(count):
+            if cold:
+                cache.clear()
+            status, elapsed, query_count = self.request(client, make_request)
+            durations.append(elapsed)
+            query_counts.append(query_count)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        wall_time = time.perf_counter() - started
+
+        durations.sort()
+        ms = lambda seconds: round(seconds * 1000, 2)
+        return {
+            'requests': count,
+            'status_codes': statuses,
+            'p50_ms': ms(percentile(durations, 50)),
+            'p95_ms': ms(percentile(durations, 95)),
+            'p99_ms': ms(percentile(durations, 99)),
+            'mean_ms': ms(sum(durations) / count),
+            'max_ms': ms(durations[-1]),
+            'throughput_rps': round(count / wall_time, 1), # a single client, requests are made one after another
+            'queries_per_request': round(sum(query_counts) / count, 2),
+            'max_queries': max(query_counts),
+        }
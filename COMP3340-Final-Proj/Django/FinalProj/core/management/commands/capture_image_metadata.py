@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Profile
+from item.cache import bump_catalog_version
+from item.models import Images, Item
+
+
+class Command(BaseCommand):
+    help = 'Reads the size and placeholder (see core/image_metadata.py) of item and profile images uploaded before they were recorded'
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        item_ids = set()
+
+        images = Images.objects.filter(width__isnull=True).exclude(image='').only('id', 'item_id', 'image')
+        for image in images.iterator(chunk_size=200):
+            if self.capture(image, ['width', 'height', 'file_size', 'format', 'placeholder']):
+                item_ids.add(image.item_id)
+                done += 1
+            else:
+                failed += 1
+
+        profiles = Profile.objects.filter(image_width__isnull=True).exclude(image='').exclude(image__isnull=True).only('id', 'image')
+        for profile in profiles.iterator(chunk_size=200):
+            if self.capture(profile, ['image_width', 'image_height', 'image_size', 'image_format', 'image_placeholder']):
+                done += 1
+            else:
+                failed += 1
+
+        if item_ids:
+            Item.objects.filter(pk__in=item_ids).update(updated_at=timezone.now()) # the pages now size their images
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Recorded the metadata of {done} image(s), {failed} failed'))
+
+    def capture(self, instance, fields):
+        try:
+            with instance.image.open('rb'):
+                captured = instance.capture_metadata()
+        except OSError:
+            captured = False
+        if not captured:
+            self.stderr.write(f'Could not read {instance.image.name}')
+            return False
+        type(instance).objects.filter(pk=instance.pk).update(**{field: getattr(instance, field) for field in fields})
+        return True
@@ -0,0 +1,82 @@
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.blobs import PINNED_MEDIA, TRACKED, reconcile_blob_references
+from core.storage import BLOB_DIR
+from item.cache import bump_catalog_version, purge_item_pages
+from item.models import Images, Item
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the files of existing uploads (item and profile images) into the content-addressed blob storage, '
+        'so each distinct file is stored once, and deletes the old copies'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many files would be merged')
+        parser.add_argument('--keep-originals', action='store_true', help='Leave the old files where they are')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = {} # old name -> blob name (None when the file is missing)
+        digests = {} # for the dry run: old name -> sha256
+        rows = 0
+
+        for model, field_name in TRACKED:
+            names = (
+                model._base_manager.exclude(**{f'{field_name}__startswith': BLOB_DIR + '/'}).exclude(**{field_name: ''})
+                .exclude(**{f'{field_name}__isnull': True}).order_by().values_list(field_name, flat=True).distinct()
+            )
+            for name in list(names): # the rows are updated while going through them
+                if name not in moved:
+                    moved[name] = self.store(name, dry_run, digests)
+                if moved[name] is None or dry_run:
+                    continue
+                changes = {field_name: moved[name]}
+                if model is Images:
+                    changes['has_thumbnails'] = False # the thumbnails are made again next to the blob
+                rows += model._base_manager.filter(**{field_name: name}).update(**changes)
+
+        stored = [name for name, blob in moved.items() if blob is not None]
+        if dry_run:
+            self.stdout.write(f'{len(stored)} files would be merged into {len(set(digests.values()))} blobs')
+            return
+
+        reconcile_blob_references()
+        if rows:
+            images = Images.objects.filter(has_thumbnails=False)
+            item_ids = list(images.values_list('item_id', flat=True).distinct())
+            call_command('generate_thumbnails', stdout=self.stdout, stderr=self.stderr)
+            Item.objects.filter(pk__in=item_ids).update(updated_at=timezone.now()) # new image URLs on their pages
+            bump_catalog_version()
+            purge_item_pages(item_ids)
+
+        deleted = 0
+        if not options['keep_originals']:
+            for name in stored:
+                if name not in PINNED_MEDIA and default_storage.exists(name):
+                    default_storage.delete(name)
+                    deleted += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {len(stored)} files ({rows} rows) into {len(set(moved[name] for name in stored))} blobs, '
+            f'deleted {deleted} old copies'
+        ))
+
+    def store(self, name, dry_run, digests):
+        if not default_storage.exists(name):
+            self.stderr.write(f'Missing file: {name}')
+            return None
+        with default_storage.open(name, 'rb') as f:
+            if dry_run:
+                digest = hashlib.sha256()
+                for chunk in f.chunks():
+                    digest.update(chunk)
+                digests[name] = digest.hexdigest()
+                return name
+            return default_storage.save(name, f) # stored under its content hash, see core/storage.py
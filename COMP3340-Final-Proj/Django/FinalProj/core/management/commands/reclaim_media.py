@@ -0,0 +1,142 @@
+import json
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.blobs import referenced_names, referenced_stems
+from core.models import Blob
+from item.thumbnails import THUMBNAIL_SIZES
+
+# Goes through the media tree a batch of files at a time and deletes the files no row uses: uploads of deleted
+# items and replaced profile pictures from before files were deleted with their rows (core/blobs.py), and
+# thumbnails whose original is gone. Each batch is looked up with a few queries and only one directory listing
+# is held at a time. The files are visited in name order and the last one done is written to the state file
+# after every batch, so a run that is stopped (or limited with --max-files) carries on where it left off.
+
+STATE_FILE = '.reclaim_media' # in MEDIA_ROOT, files and directories starting with a dot are skipped
+
+
+def walk(root, after=()):
+    # Yields (name parts, DirEntry) of the files under root in name order, skipping everything up to `after`
+    def visit(directory, parts):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except FileNotFoundError: # deleted meanwhile
+            return
+        for entry in entries:
+            path = parts + (entry.name,)
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if path >= after[:len(path)]: # a directory before the checkpoint is done already
+                    yield from visit(entry.path, path)
+            elif path > after:
+                yield path, entry
+
+    yield from visit(root, ())
+
+
+def thumbnail_source(parts):
+    # 'directory/stem' of the original a thumbnail (directory/thumbs/<size>/stem.webp) was made from, else None
+    if len(parts) >= 3 and parts[-3] == 'thumbs' and parts[-2] in THUMBNAIL_SIZES and parts[-1].endswith('.webp'):
+        return posixpath.join(*parts[:-3], parts[-1][:-len('.webp')])
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Deletes the files in MEDIA_ROOT that no item image or profile picture uses, resuming where the last run stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the files that would be deleted')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-files', type=int, default=0, help='Stop after this many files, the next run goes on from there')
+        parser.add_argument('--min-age', type=int, default=3600, help='Seconds, newer files may be uploads still being saved')
+        parser.add_argument('--restart', action='store_true', help='Start from the beginning instead of the last checkpoint')
+
+    def handle(self, *args, **options):
+        root = str(settings.MEDIA_ROOT)
+        state_path = os.path.join(root, STATE_FILE)
+        state = {} if options['restart'] else self.load_state(state_path)
+        after = tuple(state.get('after', ()))
+        if after:
+            self.stdout.write(f'Resuming after {"/".join(after)}')
+
+        self.newer_than = time.time() - options['min_age']
+        self.dry_run = options['dry_run']
+        self.seen = self.deleted = self.size = 0
+        batch, finished = [], True
+        for path, entry in walk(root, after):
+            batch.append((path, entry))
+            if len(batch) >= options['batch_size']:
+                self.reclaim(batch)
+                self.save_state(state_path, batch[-1][0])
+                batch = []
+            if options['max_files'] and self.seen + len(batch) >= options['max_files']:
+                finished = False
+                break
+        if batch:
+            self.reclaim(batch)
+            self.save_state(state_path, batch[-1][0])
+        if finished and not self.dry_run and os.path.exists(state_path):
+            os.remove(state_path) # the whole tree is done, the next run starts over
+
+        verb = 'Would delete' if self.dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {self.seen} files, {verb.lower()} {self.deleted} unused ({self.size / 2**20:.1f} MB)'
+            + ('' if finished else ', run again to continue')
+        ))
+
+    def reclaim(self, batch):
+        self.seen += len(batch)
+        files = {}
+        thumbnails = {} # name -> 'directory/stem' of its original
+        for path, entry in batch:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > self.newer_than:
+                continue
+            name = '/'.join(path)
+            files[name] = stat.st_size
+            source = thumbnail_source(path)
+            if source is not None:
+                thumbnails[name] = source
+
+        used = referenced_names(name for name in files if name not in thumbnails)
+        used_stems = referenced_stems(set(thumbnails.values()))
+        unused = [
+            name for name in files
+            if (name not in used if name not in thumbnails else thumbnails[name] not in used_stems)
+        ]
+
+        for name in unused:
+            self.deleted += 1
+            self.size += files[name]
+            if self.dry_run:
+                self.stdout.write(name)
+                continue
+            try:
+                os.remove(os.path.join(settings.MEDIA_ROOT, *name.split('/')))
+            except FileNotFoundError:
+                pass
+        if unused and not self.dry_run:
+            Blob.objects.filter(name__in=unused).delete()
+
+    def load_state(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_state(self, path, after):
+        if self.dry_run:
+            return
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'after': list(after)}, f)
+        os.replace(temp_path, path) # a run killed while writing keeps the previous checkpoint
@@ -0,0 +1,60 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.jobs import work, worker_name
+
+
+class Command(BaseCommand):
+    help = 'Runs the jobs of the database job queue (see core/jobs.py) in one or more worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to run')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed at a time by each worker')
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due, then exit (in this process)')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            ran = work(batch=options['batch'], once=True)
+            self.stdout.write(self.style.SUCCESS(f'Ran {ran} job(s)'))
+            return
+
+        # Every process opens its own database connection, the parent's must not be shared with the children
+        connections.close_all()
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        processes = [
+            context.Process(target=run_worker, args=(options['batch'],), name=f'worker-{i}', daemon=True)
+            for i in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {len(processes)} worker(s), Ctrl+C or SIGTERM to stop after the current jobs')
+
+        def stop(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate() # SIGTERM, handled in run_worker
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt: # the children got the SIGINT as well
+            for process in processes:
+                process.join()
+        self.stdout.write('Workers stopped')
+
+
+def run_worker(batch):
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    import django
+    django.setup() # needed with the spawn start method, harmless after fork
+    work(worker=worker_name(), batch=batch, should_stop=lambda: bool(stopping))
+    connections.close_all()
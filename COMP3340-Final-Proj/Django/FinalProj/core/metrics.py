@@ -0,0 +1,57 @@
+import threading
+from bisect import bisect_left
+
+# Tiny in-process metrics registry for the PerformanceMiddleware (core/middleware.py).
+# Every worker process keeps its own numbers, Prometheus adds them up across the scraped processes.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {} # label value -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            series = self.series.get(label)
+            if series is None:
+                series = self.series[label] = [0] * (len(self.buckets) + 2)
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for label, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{view="{label}",le="+Inf"}} {series[-1]}')
+                lines.append(f'{self.name}_sum{{view="{label}"}} {series[-2]}')
+                lines.append(f'{self.name}_count{{view="{label}"}} {series[-1]}')
+        return lines
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Total time spent in the view and middleware.', DURATION_BUCKETS)
+DB_DURATION = Histogram('http_request_db_duration_seconds', 'Time spent running SQL queries per request.', DURATION_BUCKETS)
+DB_QUERIES = Histogram('http_request_db_queries', 'Number of SQL queries per request.', QUERY_COUNT_BUCKETS)
+TEMPLATE_DURATION = Histogram('http_request_template_duration_seconds', 'Time spent rendering templates per request.', DURATION_BUCKETS)
+
+HISTOGRAMS = [REQUEST_DURATION, DB_DURATION, DB_QUERIES, TEMPLATE_DURATION]
+
+
+def render_prometheus():
+    # Prometheus text exposition format (version 0.0.4)
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,167 @@
+import contextvars
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, set_response_etag
+
+from . import page_cache, routers
+from .metrics import DB_DURATION, DB_QUERIES, REQUEST_DURATION, TEMPLATE_DURATION
+
+logger = logging.getLogger(__name__)
+
+_current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = Counter() # sql -> times it ran, to spot duplicates (N+1)
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook, wraps every query run during the request
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.query_count += 1
+            self.queries[sql] += 1
+
+    def duplicates(self):
+        return [(sql, count) for sql, count in self.queries.most_common() if count > 1]
+
+
+def current_stats():
+    # The RequestStats of the request being handled, None outside of PerformanceMiddleware
+    return _current_stats.get()
+
+
+class PerformanceMiddleware:
+    # Records the query count/time, template time and total time of each request, per URL name.
+    # They are sent back in a Server-Timing header (visible in the browser dev tools), added to the
+    # histograms served at /metrics/, and slow requests are logged together with their duplicate queries.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats.record_query))
+                response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else ('page-cache' if response.get('X-Page-Cache') == 'hit' else 'unresolved')
+
+        REQUEST_DURATION.observe(view, total)
+        DB_DURATION.observe(view, stats.db_time)
+        DB_QUERIES.observe(view, stats.query_count)
+        TEMPLATE_DURATION.observe(view, stats.template_time)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries"',
+            f'tpl;dur={stats.template_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+        if total * 1000 >= getattr(settings, 'SLOW_REQUEST_MS', 500):
+            logger.warning(
+                'Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, templates %.0f ms',
+                request.method, request.get_full_path(), view, total * 1000,
+                stats.query_count, stats.db_time * 1000, stats.template_time * 1000,
+            )
+            for sql, count in stats.duplicates():
+                logger.warning('  ran %d times: %s', count, sql)
+
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    # Read-your-writes for the replica routing in core/routers.py: POST requests and requests that send the
+    # cookie read from the primary, and a request that wrote something sets the cookie for a few seconds,
+    # long enough for the replicas to catch up.
+    COOKIE_NAME = 'use_primary'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = request.method not in ('GET', 'HEAD', 'OPTIONS') or self.COOKIE_NAME in request.COOKIES
+        token = routers.start_request(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = routers.end_request(token)
+
+        if state.wrote:
+            response.set_cookie(
+                self.COOKIE_NAME, '1', max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10), httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class PageCacheMiddleware:
+    # Serves the storefront pages (the views that call page_cache.tag_page()) to anonymous visitors from the
+    # cache, see core/page_cache.py. Only GET/HEAD requests without any cookie are answered from or stored in
+    # the cache, so nobody is sent a page meant for a session, and a response that sets a cookie (a CSRF token,
+    # a message, a session) is never stored.
+    # The pages get an ETag and Cache-Control headers, so browsers revalidate (and get a 304) and a reverse
+    # proxy may keep them for PAGE_CACHE_PROXY_SECONDS.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cacheable = request.method in ('GET', 'HEAD') and not request.COOKIES
+        if cacheable:
+            entry = page_cache.get_entry(request)
+            if entry is not None:
+                response = HttpResponse(entry['content'], status=entry['status'])
+                for name, value in entry['headers'].items():
+                    response[name] = value
+                response['X-Page-Cache'] = 'hit'
+                return get_conditional_response(request, etag=response['ETag'], response=response)
+
+        rendered_at = time.time_ns()
+        response = self.get_response(request)
+
+        tags = getattr(request, 'page_cache_tags', None)
+        if tags is None:
+            return response
+
+        patch_vary_headers(response, ('Cookie', 'X-Requested-With'))
+        if response.status_code == 304: # the view answered a conditional request itself (item/conditional.py)
+            return response
+        if not (cacheable and self.can_store(request, response)):
+            patch_cache_control(response, private=True)
+            return response
+
+        patch_cache_control(response, public=True, max_age=0, s_maxage=getattr(settings, 'PAGE_CACHE_PROXY_SECONDS', 30))
+        if not response.has_header('ETag'):
+            set_response_etag(response)
+        page_cache.set_entry(request, response, tags, rendered_at)
+        response['X-Page-Cache'] = 'miss'
+        return get_conditional_response(request, etag=response['ETag'], response=response)
+
+    def can_store(self, request, response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE') # the page contains a CSRF token
+            and not response.has_header('Cache-Control') # the view decided itself
+        )
@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
+from .image_metadata import image_metadata
+
 class CustomUser(AbstractUser):
     # Add your custom fields here
     is_admin = models.BooleanField(default=False)
@@ -13,7 +15,72 @@ class Profile(models.Model):
     address = models.CharField(max_length=200, null=True)
     phone = models.CharField(max_length=20, null=True)
     image = models.ImageField(upload_to='Profile_Images', null=True, blank=True) #uses default image if none is applied
+    # Read from the upload once, see core/image_metadata.py
+    image_width = models.PositiveIntegerField(null=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, editable=False)
+    image_size = models.PositiveBigIntegerField(null=True, editable=False)
+    image_format = models.CharField(max_length=10, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)
 
     def __str__(self):
         return f'{self.staff.username}-Profile'
+
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed: # a new upload
+            self.capture_metadata()
+        elif not self.image: # cleared, back to the default picture
+            self.image_width = self.image_height = self.image_size = None
+            self.image_format = self.image_placeholder = ''
+        super().save(*args, **kwargs)
+
+    def capture_metadata(self):
+        metadata = image_metadata(self.image)
+        if metadata:
+            self.image_width, self.image_height, self.image_size = metadata['width'], metadata['height'], metadata['size']
+            self.image_format, self.image_placeholder = metadata['format'], metadata['placeholder']
+        return metadata is not None
     
+
+
+class Blob(models.Model):
+    # A file in the content-addressed storage (core/storage.py) and how many rows use it, see core/blobs.py
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
+
+
+class Job(models.Model):
+    # A background job in the database queue, see core/jobs.py
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=255) # dotted path of the function
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    dedupe_key = models.CharField(max_length=255, null=True, blank=True) # only one queued job per key
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField() # not before, moved forward after each failed attempt
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_at', 'id'], condition=models.Q(status='queued'), name='job_queued_run_at_idx'), # claiming
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], condition=models.Q(status='queued'), name='job_queued_dedupe_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} ({self.status})'
@@ -0,0 +1,71 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Whole storefront pages for anonymous visitors are cached by PageCacheMiddleware (core/middleware.py).
+# A view opts in by calling tag_page() with the tags of what the page shows, and purge() with one of
+# those tags (item/signals.py does it when an Item, Images or Category changes) makes every page that
+# carries it stale. Purging stores the time in the tag's cache key, and an entry is only served while
+# none of its tags were purged after the page started rendering.
+#
+# Tags used by the views:
+#   'item:<id>'      the detail page of that item
+#   'category:<id>'  pages listing (or showing related) items of that category
+#   'items'          pages listing items of any category (front page, browse)
+#   'categories'     pages showing the list of categories
+
+TAG_PREFIX = 'page:tag:'
+ENTRY_PREFIX = 'page:entry:'
+
+
+def tag_page(request, *tags):
+    # Marks the page as cacheable for anonymous visitors, can be called more than once per request
+    if not hasattr(request, 'page_cache_tags'):
+        request.page_cache_tags = set()
+    request.page_cache_tags.update(tags)
+
+
+def purge(*tags):
+    cache.set_many({TAG_PREFIX + tag: time.time_ns() for tag in tags}, None)
+
+
+def is_fresh(tags, rendered_at):
+    # A tag that isn't in the cache (never purged, or evicted) can't prove the page is fresh
+    versions = cache.get_many([TAG_PREFIX + tag for tag in tags])
+    return len(versions) == len(tags) and all(version <= rendered_at for version in versions.values())
+
+
+def entry_key(request):
+    # One entry per URL (with its query string) and per X-Requested-With, the browse page answers AJAX with JSON
+    raw = '|'.join([request.get_host(), request.get_full_path(), request.headers.get('X-Requested-With', '')])
+    return ENTRY_PREFIX + hashlib.md5(raw.encode()).hexdigest()
+
+
+def get_entry(request):
+    entry = cache.get(entry_key(request))
+    if entry is None or not is_fresh(entry['tags'], entry['rendered_at']):
+        return None
+    return entry
+
+
+def set_entry(request, response, tags, rendered_at):
+    # rendered_at is when the view started, anything purged after that may be missing from the page
+    tags = sorted(tags)
+    for tag in tags:
+        cache.add(TAG_PREFIX + tag, rendered_at, None)
+    if not is_fresh(tags, rendered_at):
+        return
+    entry = {
+        'status': response.status_code,
+        'content': response.content,
+        'headers': {name: value for name, value in response.items() if name not in ('Set-Cookie', 'Server-Timing')},
+        'tags': tags,
+        'rendered_at': rendered_at,
+    }
+    cache.set(entry_key(request), entry, page_cache_timeout())
+
+
+def page_cache_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
@@ -0,0 +1,67 @@
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Sends reads of the catalog (the item app) to the read replicas in settings.DATABASE_REPLICAS and
+# everything else, all writes and select_for_update() to the primary ('default').
+# A replica lags a little behind the primary, so reads stay on the primary when they could see
+# something the visitor just changed:
+#   - inside a transaction on the primary (e.g. Item.save(), Cart.checkout()),
+#   - for the rest of a request once it has written anything, and for the whole of a POST request,
+#   - for REPLICA_STICKY_SECONDS after a request that wrote (ReplicaStickinessMiddleware sets a cookie).
+
+REPLICA_APPS = {'item'}
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self, pinned):
+        self.pinned = pinned # reads go to the primary
+        self.wrote = False
+
+
+def start_request(pinned=False):
+    return _state.set(RoutingState(pinned))
+
+
+def end_request(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def pin_to_primary():
+    state = _state.get()
+    if state is not None:
+        state.pinned = True
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in REPLICA_APPS:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        aliases = replicas()
+        return random.choice(aliases) if aliases else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
+
@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+# Session engine (settings.SESSION_ENGINE = 'core.sessions'): Django's cached_db sessions, read from the cache
+# and written through to django_session, so a request only queries the session table on a cache miss.
+# On top of that:
+#   - A session is only written when its contents really changed. Setting a key to the value it already has
+#     (or popping one and putting it back) marks the session as modified, the serialized data is compared
+#     with what was loaded before anything is written. It is still written when less than half of its
+#     lifetime is left, so the expiry of a session in use keeps moving forward.
+#   - clearsessions deletes the expired rows SESSION_CLEAR_BATCH_SIZE at a time, so it doesn't lock the
+#     whole table at once.
+# With the local-memory cache every process has its own copy of a session, and a change made in one process
+# only reaches the others when their copy expires after SESSION_CACHE_SECONDS. So there only anonymous
+# sessions (a cart id) are cached, the sessions of logged in users are read from the database every time,
+# a user who logged out or changed their password is logged out in every process at once. With a shared
+# cache (memcached, redis) all sessions are cached.
+
+KEY_PREFIX = 'core.sessions'
+
+
+def cache_seconds():
+    return getattr(settings, 'SESSION_CACHE_SECONDS', 60)
+
+
+def clear_batch_size():
+    return getattr(settings, 'SESSION_CLEAR_BATCH_SIZE', 1000)
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._stored = None # (serialized data, expiry date) as it is in the database
+
+    def _serialized(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        try:
+            stored = self._cache.get(self.cache_key)
+        except Exception: # invalid key for the backend, like in cached_db
+            stored = None
+
+        if stored is None:
+            s = self._get_session_from_db()
+            if not s:
+                self._stored = None
+                return {}
+            data = self.decode(s.session_data)
+            stored = (data, s.expire_date)
+            self._cache_set(data, s.expire_date)
+        data, expire_date = stored
+        if expire_date <= timezone.now():
+            self._session_key = None # like the database backend, an expired session is a new one
+            self._stored = None
+            return {}
+        self._stored = (self._serialized(data), expire_date)
+        return data
+
+    def _cacheable(self, data):
+        return SESSION_KEY not in data or not isinstance(self._cache, LocMemCache)
+
+    def _cache_set(self, data, expire_date):
+        if not self._cacheable(data):
+            self._cache.delete(self.cache_key) # e.g. the anonymous copy from before logging in
+            return
+        age = (expire_date - timezone.now()).total_seconds()
+        self._cache.set(self.cache_key, (data, expire_date), max(0, min(age, cache_seconds())))
+
+    def unchanged(self):
+        if self._stored is None or self.session_key is None:
+            return False
+        serialized, expire_date = self._stored
+        refresh_after = expire_date - timedelta(seconds=self.get_expiry_age() / 2)
+        return serialized == self._serialized(self._get_session(no_load=True)) and timezone.now() < refresh_after
+
+    def save(self, must_create=False):
+        if not must_create and self.unchanged():
+            return
+        super(CachedDBStore, self).save(must_create) # the database backend
+        expire_date = self.get_expiry_date()
+        self._stored = (self._serialized(self._session), expire_date)
+        self._cache_set(self._session, expire_date)
+
+    def delete(self, session_key=None):
+        if session_key is None or session_key == self.session_key:
+            self._stored = None
+        super().delete(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        # Returns how many sessions were deleted
+        model = cls.get_model_class()
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(model.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:clear_batch_size()])
+            if not keys:
+                return deleted
+            deleted += model.objects.filter(session_key__in=keys, expire_date__lt=now).delete()[0]
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+# Default storage for every upload (settings.STORAGES). Each upload is hashed while it is written to disk and
+# stored once under its SHA-256, e.g. blobs/3f/a2/3fa2...e1.jpg, so the same picture uploaded five times is one
+# file. A blob's name is its content, so it never changes and can be cached forever (see core.views.blob).
+# The rows using each blob are counted in core.models.Blob, see core/blobs.py.
+#
+# Derived files (the thumbnails made from an upload, item/thumbnails.py, in a thumbs/ directory next to it) and
+# names that are already inside the blob tree are stored under exactly the name they are given.
+
+BLOB_DIR = 'blobs'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_DIR + '/')
+
+
+def is_derived(name):
+    # item_images/thumbs/card/cpu.webp, blobs/3f/a2/thumbs/card/3fa2...e1.webp
+    return 'thumbs' in posixpath.dirname(name).split('/')
+
+
+def blob_name(digest, extension):
+    return posixpath.join(BLOB_DIR, digest[:2], digest[2:4], digest + extension.lower())
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        if is_blob(name) or is_derived(name):
+            return super()._save(name, content)
+
+        temp_dir = self.path(posixpath.join(BLOB_DIR, 'tmp'))
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir) # same filesystem, so the rename below is atomic
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            name = blob_name(digest.hexdigest(), posixpath.splitext(name)[1])
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(temp_path) # stored already
+                os.utime(path) # so a pending delete of the last copy leaves it alone (core/blobs.py)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Uploads are renamed after their content anyway, only derived files keep the name they are given
+        if is_blob(name) or is_derived(name):
+            return super().get_available_name(name, max_length)
+        return name
@@ -0,0 +1,29 @@
+import time
+
+from django.template.backends.django import DjangoTemplates, Template
+
+from .middleware import current_stats
+
+# The Django template backend, except that the time spent rendering a template is added to the stats of the
+# current request (the tpl entry of Server-Timing and /metrics/, see core/middleware.py). Templates have no
+# hook for that, hence a backend of its own, set in settings.TEMPLATES.
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current_stats()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
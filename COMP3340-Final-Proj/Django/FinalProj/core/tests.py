@@ -1,3 +1,589 @@
-from django.test import TestCase
+import json
+import os
+from datetime import timedelta
+import tempfile
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core import routers
+from core import jobs
+from core.models import Blob, CustomUser, Job, Profile
+from core.sessions import SessionStore
+from core.views import blob
+from dashboard.models import Cart, CartLine
+from item.counters import reconcile_category_counts
+from item.models import Category, Images, Item
+from item.thumbnails import THUMBNAIL_SIZES, generate_thumbnails, thumbnail_name
+from PIL import Image
+
+
+class BenchmarkCommandTests(TestCase):
+    # Smoke test for the load-testing commands, so they keep working as the views change
+
+    def test_seed_and_benchmark(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            call_command('seed_catalog', items=30, categories=3, managers=2, customers=2, stdout=StringIO())
+            out = StringIO()
+            call_command('benchmark', requests=2, export_requests=1, warmup=0, stdout=out, stderr=StringIO())
+
+        self.assertEqual(Item.objects.count(), 30)
+        self.assertEqual(sum(Category.objects.values_list('item_count', flat=True)), 30)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['items'], 30)
+        for name, result in report['scenarios'].items():
+            self.assertEqual(set(result['status_codes']) - {'200', '302'}, set(), name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+
+def jpeg(colour):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), colour).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media_root = media_root.name
+        self.user = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.item = Item.objects.create(category=Category.objects.create(name='CPU'), created_by=self.user, name='Ryzen', price=1, stock=1)
+
+    def references(self, name):
+        return Blob.objects.get(name=name).references
+
+    def test_the_same_upload_is_stored_once_and_counted(self):
+        first = Images.objects.create(item=self.item, image=ContentFile(jpeg('red'), 'ryzen.jpg'))
+        second = Images.objects.create(item=self.item, image=ContentFile(jpeg('red'), 'ryzen_copy.JPG'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        call_command('runworker', once=True, stdout=StringIO()) # the thumbnails are a background job
+        self.assertTrue(default_storage.exists(thumbnail_name(first.image.name, 'card')))
+        self.assertEqual(self.references(first.image.name), 2)
+
+        second.delete()
+        self.assertEqual(self.references(first.image.name), 1)
+
+    def test_replaced_profile_picture_is_released(self):
+        profile = Profile.objects.create(staff=self.user, image=ContentFile(jpeg('red'), 'me.jpg'))
+        old = profile.image.name
+        profile = Profile.objects.get(pk=profile.pk)
+        profile.image = ContentFile(jpeg('blue'), 'me.jpg')
+        profile.save()
+        self.assertEqual((self.references(old), self.references(profile.image.name)), (0, 1))
+
+    def test_thumbnails_of_older_uploads_are_stored_next_to_them(self):
+        path = os.path.join(self.media_root, 'item_images', 'legacy.jpg') # saved before the blob storage
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(jpeg('red'))
+        image = Images.objects.bulk_create([Images(item=self.item, image='item_images/legacy.jpg')])[0]
+
+        self.assertTrue(generate_thumbnails(image.image))
+        for size in THUMBNAIL_SIZES:
+            self.assertTrue(default_storage.exists(thumbnail_name('item_images/legacy.jpg', size)), size)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'blobs')))
+
+    def test_blobs_are_served_as_immutable(self):
+        image = Images.objects.create(item=self.item, image=ContentFile(jpeg('red'), 'ryzen.jpg'))
+        # The URL is only routed when DEBUG is on, the tests run without it
+        response = blob(RequestFactory().get('/'), image.image.name.split('/', 1)[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_dedupe_media_merges_existing_copies(self):
+        for name in ['item_images/ryzen.jpg', 'item_images/ryzen_x1Y2z3.jpg', 'Profile_Images/KellenPic.png', 'item_images/KellenPic.png']:
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(jpeg('blue' if 'Kellen' in name else 'red'))
+        Images.objects.bulk_create([
+            Images(item=self.item, image='item_images/ryzen.jpg', has_thumbnails=True),
+            Images(item=self.item, image='item_images/ryzen_x1Y2z3.jpg', has_thumbnails=True),
+            Images(item=self.item, image='item_images/KellenPic.png'),
+        ])
+        Profile.objects.bulk_create([Profile(staff=self.user, image='Profile_Images/KellenPic.png')])
+
+        call_command('dedupe_media', stdout=StringIO())
+
+        names = set(Images.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 2)
+        kellen = Profile.objects.get().image.name
+        self.assertIn(kellen, names)
+        self.assertEqual(self.references(kellen), 2)
+        self.assertFalse(Images.objects.filter(has_thumbnails=False).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'item_images/ryzen.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'item_images/KellenPic.png'))) # linked by contact.html
+
+    @override_settings(BLOB_DELETE_GRACE=0)
+    def test_files_are_deleted_after_their_rows(self):
+        other = Item.objects.create(category=self.item.category, created_by=self.user, name='Ryzen 7', price=1, stock=1)
+        shared = Images.objects.create(item=self.item, image=ContentFile(jpeg('red'), 'ryzen.jpg')).image.name
+        Images.objects.create(item=other, image=ContentFile(jpeg('red'), 'ryzen.jpg'))
+        own = Images.objects.create(item=self.item, image=ContentFile(jpeg('blue'), 'box.jpg')).image.name
+        call_command('runworker', once=True, stdout=StringIO())
+
+        deletes = Job.objects.filter(task='core.blobs.delete_unused_files', status=Job.QUEUED)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.delete()
+            self.assertFalse(deletes.exists()) # nothing happens before the commit
+        self.assertEqual(deletes.count(), 1) # one job for both files
+        call_command('runworker', once=True, stdout=StringIO())
+
+        self.assertFalse(default_storage.exists(own))
+        self.assertFalse(default_storage.exists(thumbnail_name(own, 'card')))
+        self.assertTrue(default_storage.exists(shared)) # the other item still uses it
+        self.assertTrue(default_storage.exists(thumbnail_name(shared, 'card')))
+
+        profile = Profile.objects.create(staff=self.user, image=ContentFile(jpeg('green'), 'me.jpg'))
+        old = profile.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.image = ContentFile(jpeg('white'), 'me.jpg')
+            profile.save()
+        call_command('runworker', once=True, stdout=StringIO())
+        self.assertFalse(default_storage.exists(old))
+        self.assertTrue(default_storage.exists(profile.image.name))
+
+    def test_reclaim_media_resumes_where_it_stopped(self):
+        used = Images.objects.create(item=self.item, image=ContentFile(jpeg('red'), 'ryzen.jpg')).image.name
+        orphan_blob = 'blobs/00/00/' + '0' * 64 + '.jpg'
+        Blob.objects.create(name=orphan_blob)
+        orphans = [orphan_blob, 'item_images/old.jpg', 'item_images/thumbs/card/old.webp', 'Profile_Images/me.png']
+        kept = [used, thumbnail_name(used, 'card'), 'item_images/windsor.jpg', 'item_images/thumbs/card/windsor.webp']
+        for name in orphans + kept[1:]:
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'x')
+
+        call_command('reclaim_media', dry_run=True, min_age=0, stdout=StringIO())
+        self.assertTrue(all(default_storage.exists(name) for name in orphans))
+
+        out = StringIO()
+        call_command('reclaim_media', min_age=0, batch_size=2, max_files=3, stdout=out)
+        self.assertIn('run again', out.getvalue())
+        self.assertFalse(default_storage.exists('Profile_Images/me.png')) # the first files in name order
+        self.assertTrue(default_storage.exists('item_images/old.jpg'))
+
+        out = StringIO()
+        call_command('reclaim_media', min_age=0, stdout=out)
+        self.assertIn('Resuming after', out.getvalue())
+        self.assertEqual([name for name in orphans if default_storage.exists(name)], [])
+        self.assertTrue(all(default_storage.exists(name) for name in kept))
+        self.assertFalse(Blob.objects.filter(name=orphan_blob).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, '.reclaim_media'))) # done, starts over next time
+
+
+
+CALLS = []
+
+
+def record(*args, **kwargs):
+    CALLS.append((args, kwargs))
+
+
+def explode():
+    raise ValueError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_jobs_run_once_with_their_arguments(self):
+        job = jobs.enqueue(record, 1, 'two', three=3)
+        self.assertEqual(jobs.enqueue(record, 1, 'two', three=3, dedupe_key='same').pk, job.pk + 1)
+        self.assertEqual(jobs.enqueue(record, 9, dedupe_key='same').args, [1, 'two']) # already waiting
+
+        self.assertEqual(jobs.work(once=True), 2)
+        self.assertEqual(CALLS, [((1, 'two'), {'three': 3})] * 2)
+        self.assertEqual(set(Job.objects.values_list('status', flat=True)), {Job.DONE})
+        self.assertEqual(jobs.claim('worker'), [])
+
+    def test_delayed_jobs_wait(self):
+        jobs.enqueue(record, delay=60)
+        self.assertEqual(jobs.work(once=True), 0)
+
+    @override_settings(JOB_RETRY_DELAY=0)
+    def test_failures_are_retried_with_backoff_then_kept(self):
+        job = jobs.enqueue(explode, max_attempts=2)
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.work(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIn('ValueError: boom', job.last_error)
+
+        with override_settings(JOB_RETRY_DELAY=30), self.assertLogs('core.jobs', 'ERROR'):
+            job = jobs.enqueue(explode)
+            jobs.work(once=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=25))
+
+    def test_a_job_is_claimed_by_one_worker(self):
+        jobs.enqueue(record)
+        self.assertEqual(len(jobs.claim('first')), 1)
+        self.assertEqual(jobs.claim('second'), [])
+
+    @override_settings(JOB_TIMEOUT=0, JOB_RETRY_DELAY=0)
+    def test_jobs_of_a_dead_worker_are_run_again(self):
+        jobs.enqueue(record)
+        jobs.claim('dead')
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.work(once=True), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.token = routers.start_request()
+
+    def tearDown(self):
+        routers.end_request(self.token)
+
+    def test_catalog_reads_go_to_a_replica(self):
+        self.assertEqual(self.router.db_for_read(Item), 'replica')
+        self.assertEqual(self.router.db_for_read(Category), 'replica')
+        self.assertEqual(self.router.db_for_read(CustomUser), 'default')
+        self.assertEqual(self.router.db_for_read(Cart), 'default')
+
+    def test_writes_and_locking_reads_go_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(Item), 'default')
+        self.assertEqual(Item.objects.select_for_update().db, 'default')
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        self.router.db_for_write(Item)
+        self.assertEqual(self.router.db_for_read(Item), 'default')
+
+    def test_pinned_request_reads_from_the_primary(self):
+        routers.end_request(self.token)
+        self.token = routers.start_request(pinned=True)
+        self.assertEqual(self.router.db_for_read(Item), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Item), 'default')
+
+
+class ReplicaStickinessTests(TestCase):
+    def test_a_request_that_writes_sets_the_cookie(self):
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        item = Item.objects.create(category=Category.objects.create(name='CPU'), created_by=manager, name='Ryzen', price=1, stock=1)
+
+        response = self.client.get(reverse('item:browse'))
+        self.assertNotIn('use_primary', response.cookies)
+
+        response = self.client.get(reverse('dashboard:add_to_cart', args=[item.pk]))
+        self.assertIn('use_primary', response.cookies)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def test_server_timing_header(self):
+        cache.clear() # rendered, not from the page cache
+        response = self.client.get(reverse('item:browse'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertNotIn('tpl;dur=0.0,', response['Server-Timing']) # timed by core/template_backends.py
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_metrics_exposition(self):
+        self.client.get(reverse('item:browse'))
+        response = self.client.get(reverse('core:metrics')) # from 127.0.0.1
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        for name in ['http_request_duration_seconds', 'http_request_db_duration_seconds', 'http_request_db_queries', 'http_request_template_duration_seconds']:
+            self.assertIn(f'# TYPE {name} histogram', body)
+        self.assertIn('http_request_db_queries_bucket{view="item:browse",le="+Inf"}', body)
+        self.assertRegex(body, r'http_request_duration_seconds_count\{view="item:browse"\} [1-9]')
+
+    def test_metrics_are_for_staff_allowed_ips_and_the_token(self):
+        url = reverse('core:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403) # nobody by default, not even 127.0.0.1
+        with self.settings(METRICS_ALLOWED_IPS=['203.0.113.5']):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.5').status_code, 200)
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer guess').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 403) # no token set
+
+        user = get_user_model().objects.create_user(username='customer', is_customer=True)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.5').status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.5').status_code, 200)
+
+
+class SessionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def session_queries(self, queries):
+        return [query['sql'] for query in queries.captured_queries if 'django_session' in query['sql']]
+
+    def test_sessions_are_read_from_the_cache(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }): # shared by the processes of a server
+            customer = get_user_model().objects.create_user(username='customer', is_customer=True)
+            self.client.force_login(customer)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('core:profile'))
+                self.client.get(reverse('dashboard:cart'))
+            self.assertEqual(self.session_queries(queries), [])
+
+            cache.clear() # e.g. evicted, it falls back to the database
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(reverse('core:profile')).status_code, 200)
+            self.assertEqual(len(self.session_queries(queries)), 1)
+
+    def test_local_memory_cache_only_keeps_anonymous_sessions(self):
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        item = Item.objects.create(category=Category.objects.create(name='CPU'), created_by=manager, name='Ryzen', price=1, stock=5)
+        self.client.get(reverse('dashboard:add_to_cart', args=[item.pk])) # the cart id goes in the session
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard:cart'))
+        self.assertEqual(self.session_queries(queries), [])
+
+        # Another process wouldn't see a logout in this one, so a logged in user's session is always read
+        customer = get_user_model().objects.create_user(username='customer', is_customer=True)
+        self.client.force_login(customer)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard:cart'))
+            self.client.get(reverse('dashboard:cart'))
+        self.assertEqual(len(self.session_queries(queries)), 2)
+        self.assertIsNone(cache.get(SessionStore.cache_key_prefix + self.client.session.session_key))
+
+    def test_unchanged_sessions_are_not_written(self):
+        session = SessionStore()
+        session['cart_id'] = 1
+        session.save()
+
+        session = SessionStore(session.session_key)
+        session['cart_id'] = 1 # modified, but the same data
+        with self.assertNumQueries(0):
+            session.save()
+
+        session['cart_id'] = 2
+        with CaptureQueriesContext(connection) as queries:
+            session.save()
+        self.assertEqual(len(self.session_queries(queries)), 1)
+        cache.clear()
+        self.assertEqual(SessionStore(session.session_key)['cart_id'], 2)
+
+    def test_cart_at_the_stock_limit_does_not_write_the_session(self):
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        item = Item.objects.create(category=Category.objects.create(name='CPU'), created_by=manager, name='Ryzen', price=1, stock=1)
+        self.client.get(reverse('dashboard:add_to_cart', args=[item.pk])) # anonymous, the cart id goes in the session
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard:increase_quantity', args=[item.pk]))
+            self.client.get(reverse('dashboard:add_to_cart', args=[item.pk]))
+        self.assertEqual(self.session_queries(queries), [])
+
+    @override_settings(SESSION_CLEAR_BATCH_SIZE=2)
+    def test_expired_sessions_are_cleared_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create([Session(session_key=f'expired{i}', session_data='', expire_date=past) for i in range(5)])
+        session = SessionStore()
+        session.create()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(SessionStore.clear_expired(), 5)
+        self.assertEqual(len(self.session_queries(queries)), 7) # 3 batches of a select and a delete, then the last select
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [session.session_key])
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.cpu = Category.objects.create(name='CPU')
+        self.gpu = Category.objects.create(name='GPU')
+        self.item = Item.objects.create(category=self.cpu, created_by=manager, name='Ryzen', price=1, stock=1)
+        self.other = Item.objects.create(category=self.gpu, created_by=manager, name='Radeon', price=1, stock=1)
+
+    def test_anonymous_pages_are_served_from_the_cache(self):
+        url = reverse('item:detail', args=[self.item.pk])
+        first = self.client.get(url)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        self.assertIn('public', first['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    def test_changes_purge_only_the_pages_showing_them(self):
+        item_url = reverse('item:detail', args=[self.item.pk])
+        other_url = reverse('item:detail', args=[self.other.pk])
+        self.client.get(item_url)
+        self.client.get(other_url)
+
+        self.item.stock = 5
+        self.item.save()
+
+        self.assertEqual(self.client.get(item_url)['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(other_url)['X-Page-Cache'], 'hit')
+
+    def test_facets_follow_changes_in_other_categories(self):
+        # A page filtered to CPU still counts the GPU items in its facets
+        browse = reverse('item:browse') + f'?category={self.cpu.pk}'
+        api = reverse('item:api_items') + f'?category={self.cpu.pk}'
+        self.client.get(browse)
+        self.client.get(api)
+        Item.objects.create(category=self.gpu, created_by=self.other.created_by, name='Radeon 2', price=1, stock=1)
+
+        for url in [browse, api]:
+            response = self.client.get(url)
+            self.assertEqual(response['X-Page-Cache'], 'miss', url)
+        gpu = next(row for row in response.json()['facets']['categories'] if row['id'] == self.gpu.pk)
+        self.assertEqual(gpu['count'], 2)
+
+    def test_moving_an_item_purges_its_old_category(self):
+        url = reverse('item:browse') + f'?category={self.cpu.pk}'
+        self.client.get(url)
+
+        item = Item.objects.get(pk=self.item.pk)
+        item.category = self.gpu
+        item.save()
+
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+
+    def test_visitors_with_cookies_are_not_cached(self):
+        self.client.cookies['sessionid'] = 'abc'
+        response = self.client.get(reverse('core:index'))
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_pages_with_a_csrf_token_are_not_cached(self):
+        self.client.get(reverse('core:login'))
+        self.assertNotIn('X-Page-Cache', self.client.get(reverse('core:login')))
+
+
+# How many SQL queries each view may run, with the cache cleared first (so this is the cost of a miss).
+# Logged in requests include the queries for the session and the user, with the local-memory cache only
+# anonymous sessions are cached (core/sessions.py).
+# Every view is requested at each size in CATALOG_SIZES: that many items, each with two images, all in
+# the customer's cart and all created by the manager. A budget is `queries` plus `per_item` for every
+# item, per_item is only non-zero where the view really has to touch each row (checkout reserves the
+# stock of every cart line). An N+1 shows up as a count that grows with the catalog.
+# The budgets are ceilings: if a change makes a view cheaper, lower its budget in the same commit.
+#
+#   (view name, url arguments, user, method, queries, per_item)
+QUERY_BUDGETS = [
+    ('core:index', (), None, 'get', 3, 0),
+    ('core:about', (), None, 'get', 0, 0),
+    ('core:contact', (), None, 'get', 0, 0),
+    ('core:privacy', (), None, 'get', 0, 0),
+    ('core:signup', (), None, 'get', 0, 0),
+    ('core:login', (), None, 'get', 0, 0),
+    ('core:logout', (), 'customer', 'get', 4, 0),
+    ('core:profile', (), 'customer', 'get', 3, 0),
+    ('core:profile-update', (), 'customer', 'get', 6, 0),
+    ('core:metrics', (), None, 'get', 0, 0),
+    ('item:browse', (), None, 'get', 4, 0), # 1 for the facets (item/facets.py)
+    ('item:browse', ('search',), None, 'get', 4, 0),
+    ('item:browse', ('category',), None, 'get', 4, 0),
+    ('item:browse', ('ajax',), None, 'get', 4, 0), # and 1 for the ETag/Last-Modified (item/conditional.py)
+    ('item:detail', ('item',), None, 'get', 5, 0), # 1 for the ETag/Last-Modified
+    ('item:new', (), 'manager', 'get', 3, 0),
+    ('item:edit', ('item',), 'manager', 'get', 4, 0),
+    ('item:delete', ('item',), 'manager', 'get', 9, 0),
+    ('item:export_items_to_csv', (), 'manager', 'get', 1, 0),
+    ('item:import_items', (), 'manager', 'get', 2, 0),
+    ('item:api_items', (), None, 'get', 4, 0), # validators, page, first images, facets
+    ('item:api_categories', (), None, 'get', 1, 0),
+    ('item:suggest', ('prefix',), None, 'get', 2, 0), # building the prefix index (item/suggest.py), then none
+    ('dashboard:index', (), 'manager', 'get', 4, 0),
+    ('dashboard:cart', (), 'customer', 'get', 5, 0),
+    ('dashboard:add_to_cart', ('item',), 'customer', 'get', 5, 0),
+    ('dashboard:remove_from_cart', ('item',), 'customer', 'get', 4, 0),
+    ('dashboard:increase_quantity', ('item',), 'customer', 'get', 4, 0),
+    ('dashboard:decrease_quantity', ('item',), 'customer', 'get', 4, 0),
+    ('dashboard:checkout', (), 'customer', 'post', 11, 1),
+]
+CATALOG_SIZES = [1, 10, 100]
+
+
+@override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']) # the test client's address
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = {
+            'manager': User.objects.create_user(username='manager', is_inventoryManager=True),
+            'customer': User.objects.create_user(username='customer', is_customer=True),
+        }
+        cls.category = Category.objects.create(name='CPU')
+
+    def seed(self, size):
+        items = Item.objects.bulk_create([
+            Item(category=self.category, created_by=self.users['manager'], name=f'Ryzen {i}', price=100 + i, stock=5)
+            for i in range(size)
+        ])
+        Images.objects.bulk_create([
+            Images(item=item, image=f'item_images/ryzen{n}.jpg', has_thumbnails=True) for item in items for n in range(2)
+        ])
+        cart = Cart.objects.create(user=self.users['customer'])
+        CartLine.objects.bulk_create([CartLine(cart=cart, item=item) for item in items])
+        reconcile_category_counts()
+        return items
+
+    def request(self, view, args, method, item):
+        url_args, params, headers = [], {}, {}
+        for arg in args:
+            if arg == 'item':
+                url_args.append(item.pk)
+            elif arg == 'search':
+                params['query'] = 'ryzen'
+            elif arg == 'category':
+                params['category'] = self.category.pk
+            elif arg == 'prefix':
+                params['q'] = 'ryz'
+            elif arg == 'ajax':
+                headers['HTTP_X_REQUESTED_WITH'] = 'XMLHttpRequest'
+        response = getattr(self.client, method)(reverse(view, args=url_args), params, **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_query_budgets(self):
+        for size in CATALOG_SIZES:
+            with transaction.atomic():
+                items = self.seed(size)
+                for view, args, user, method, queries, per_item in QUERY_BUDGETS:
+                    with self.subTest(view=view, args=args, items=size), transaction.atomic():
+                        cache.clear()
+                        if user:
+                            self.client.force_login(self.users[user])
+                        with CaptureQueriesContext(connection) as captured:
+                            response = self.request(view, args, method, items[0])
+                        self.assertLess(response.status_code, 400)
+                        budget = queries + per_item * size
+                        executed = [query['sql'] for query in captured.captured_queries]
+                        self.assertLessEqual(
+                            len(executed), budget,
+                            f'{len(executed)} queries, budget is {budget}:\n' + '\n'.join(executed),
+                        )
+                        transaction.set_rollback(True)
+                    self.client.logout()
+                transaction.set_rollback(True)
@@ -16,4 +16,5 @@ urlpatterns = [
     path('profile/update/', views.profile_update, name='profile-update'),
     path('logout', views.logout_user, name='logout'),
     path('privacy/', views.privacy, name='privacy'),  
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
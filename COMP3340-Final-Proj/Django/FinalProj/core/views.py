@@ -1,38 +1,56 @@
+import os
+
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, logout
 from django.contrib.auth.decorators import login_required
 from item.models import Category, Item
 from django.contrib import messages
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.views.static import serve
 
 from .forms import SignupForm, UserUpdateForm, ProfileUpdateForm #this is from the forms.py SignupForm we created
+from .metrics import render_prometheus
 from .models import Profile
+from .page_cache import tag_page
+from .storage import BLOB_DIR
 
-from django.core.paginator import Paginator
+from item.cache import cache_timeout, catalog_cache_key
+from item.pagination import CursorPaginator
 
 # Creating our first view
 def index(request):
-    items = Item.objects.filter(is_sold=False) #Obviously adjust this if we're not using the is_sold thing
+    items = Item.objects.filter(is_sold=False).prefetch_related('images') #Obviously adjust this if we're not using the is_sold thing
     categories = Category.objects.all()
 
-    p = Paginator(items, 6)
-    page = request.GET.get('page')
-    items_list = p.get_page(page)
+    p = CursorPaginator(items, 6) # newest first, paged by (created_at, id) cursor
+    cursor = request.GET.get('cursor')
+    items_list = p.get_page(cursor)
 
-    numPages = "a" * items_list.paginator.num_pages
+    tag_page(request, 'items', 'categories') # anonymous visitors get the whole page from the cache, see core/page_cache.py
 
+    # Nothing is queried until the template renders, and the grid and category fragments are cached (see item/cache.py)
     return render(request, 'core/index.html', {
         'categories': categories,
         'items': items_list,
-        'numPages': numPages
+        'grid_key': catalog_cache_key('index_grid', cursor),
+        'categories_key': catalog_cache_key('index_categories'),
+        'cache_timeout': cache_timeout(),
     })
 
 def contact(request):
+    tag_page(request)
     return render(request, 'core/contact.html')
 
 def about(request):
+    tag_page(request)
     return render(request, 'core/about.html')
 
 def privacy(request):
+    tag_page(request)
     return render(request, 'core/privacy.html')
 
 
@@ -78,4 +96,23 @@ def profile_update(request):
         'user_form': user_form,
         'profile_form': profile_form,
     }
-    return render(request, 'core/profile_update.html', context)
\ No newline at end of file
+    return render(request, 'core/profile_update.html', context)
+
+# Prometheus scrape endpoint for the histograms recorded by core.middleware.PerformanceMiddleware
+def metrics(request):
+    # For staff, METRICS_ALLOWED_IPS and requests with the METRICS_TOKEN bearer token (see settings.py)
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not (
+        request.user.is_staff
+        or request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+        or token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    ):
+        raise PermissionDenied
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Files in the content-addressed storage (core/storage.py) never change, so they are served with a far-future
+# Cache-Control. Only wired up where Django serves the media itself (DEBUG), the web server does it otherwise.
+def blob(request, path):
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, BLOB_DIR))
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'BLOB_CACHE_SECONDS', 365 * 24 * 3600), immutable=True)
+    return response
@@ -1,3 +1,9 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import Cart, CartLine, Order, OrderLine
+
+admin.site.register(Cart)
+admin.site.register(CartLine)
+admin.site.register(Order)
+admin.site.register(OrderLine)
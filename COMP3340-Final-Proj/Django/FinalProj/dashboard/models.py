@@ -1,3 +1,129 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Least
+from django.utils import timezone
 
-# Create your models here.
+from item.cache import bump_catalog_version, purge_item_pages
+from item.counters import adjust_category_counts
+from item.models import Item
+
+
+class OutOfStock(Exception):
+    def __init__(self, item):
+        super().__init__(f'Not enough stock of {item.name}')
+        self.item = item
+
+
+TAX_RATE = 0.13
+
+
+# The shopping cart lives in the database instead of the session, so the session only holds
+# the id of an anonymous cart and every quantity change is a single-row UPDATE.
+class Cart(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, related_name='cart', on_delete=models.CASCADE, null=True, blank=True)
+    session_key = models.CharField(max_length=40, null=True, blank=True, db_index=True) # for carts of visitors who aren't logged in
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        if self.user_id:
+            return f'{self.user.username}-Cart'
+        return f'Anonymous-Cart-{self.pk}'
+
+    def merge_into(self, other):
+        # Moves this (anonymous) cart's lines into `other` and deletes this cart.
+        # Quantities of items that are in both carts are added together, up to the stock of the item
+        # (but at least 1, checkout tells the user about items that sold out meanwhile).
+        with transaction.atomic():
+            quantities = dict(self.lines.values_list('item_id', 'quantity'))
+            shared = dict(other.lines.filter(item_id__in=quantities).values_list('item_id', 'item__stock'))
+            for item_id, stock in shared.items():
+                other.lines.filter(item_id=item_id).update(quantity=Least(F('quantity') + quantities[item_id], Value(max(stock, 1))))
+            self.lines.exclude(item_id__in=shared).update(cart=other)
+            self.delete()
+
+    def checkout(self):
+        # Reserves the stock of every line and turns the cart into an Order, all in one transaction.
+        # Raises OutOfStock (and changes nothing) if any item doesn't have enough stock left.
+        with transaction.atomic():
+            lines = list(self.lines.select_related('item').order_by('item_id'))
+            if not lines:
+                return None
+
+            # Each reservation is a conditional UPDATE, so the stock check and the decrement happen atomically
+            # in the database and concurrent buyers can't both take the last unit. The rows are always
+            # locked in item id order, so two checkouts with the same items can't deadlock each other.
+            for line in lines:
+                reserved = Item.objects.filter(pk=line.item_id, stock__gte=line.quantity).update(
+                    stock=F('stock') - line.quantity,
+                    # SET expressions see the old row, so this is "the new stock is 0"
+                    is_sold=Case(When(stock=line.quantity, then=Value(True)), default=Value(False)),
+                    updated_at=timezone.now(),
+                )
+                if not reserved:
+                    raise OutOfStock(line.item)
+
+            # queryset.update() skips Item.save() and the signals, so keep the category counters and the cache in sync here
+            sold_out = Item.objects.filter(pk__in=[line.item_id for line in lines], stock=0).values_list('category_id', flat=True)
+            for category_id in sold_out:
+                adjust_category_counts(category_id, available=-1)
+            transaction.on_commit(bump_catalog_version)
+            item_ids = [line.item_id for line in lines]
+            category_ids = {line.item.category_id for line in lines}
+            transaction.on_commit(lambda: purge_item_pages(item_ids, category_ids)) # the stock shown on the pages changed
+
+            sub_total = sum(line.total for line in lines)
+            order = Order.objects.create(user=self.user, sub_total=sub_total, tax=sub_total * TAX_RATE)
+            OrderLine.objects.bulk_create([
+                OrderLine(order=order, item=line.item, name=line.item.name, price=line.item.price, quantity=line.quantity)
+                for line in lines
+            ])
+            self.lines.all().delete()
+        return order
+
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(Cart, related_name='lines', on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, related_name='cart_lines', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        ordering = ('id',)
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'item'], name='unique_cart_item'),
+        ]
+
+    @property
+    def total(self):
+        return self.quantity * self.item.price
+
+    def __str__(self):
+        return f'{self.quantity} x {self.item.name}'
+
+
+class Order(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='orders', on_delete=models.SET_NULL, null=True, blank=True)
+    sub_total = models.FloatField()
+    tax = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+
+    @property
+    def total(self):
+        return self.sub_total + self.tax
+
+    def __str__(self):
+        return f'Order-{self.pk}'
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, related_name='lines', on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, related_name='order_lines', on_delete=models.SET_NULL, null=True) # name/price are copied so the order survives the item
+    name = models.CharField(max_length=255)
+    price = models.FloatField()
+    quantity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f'{self.quantity} x {self.name}'
@@ -0,0 +1,16 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .models import Cart
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    # Whatever was added to the cart before logging in ends up in the user's cart
+    cart_id = request.session.pop('cart_id', None)
+    if cart_id is None:
+        return
+    anonymous_cart = Cart.objects.filter(pk=cart_id, user=None).first()
+    if anonymous_cart is not None:
+        user_cart, created = Cart.objects.get_or_create(user=user)
+        anonymous_cart.merge_into(user_cart)
@@ -1,3 +1,242 @@
-from django.test import TestCase
+import threading
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from item.models import Category, Item
+from .models import Cart, CartLine, Order, OutOfStock
+
+
+def make_item(category, user, stock, name='Ryzen 5 7600X', price=100):
+    return Item.objects.create(category=category, name=name, price=price, stock=stock, created_by=user)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.manager = User.objects.create_user(username='manager', is_inventoryManager=True)
+        self.customer = User.objects.create_user(username='customer', is_customer=True)
+        self.category = Category.objects.create(name='CPU')
+        self.cart = Cart.objects.create(user=self.customer)
+
+    def test_checkout_reserves_stock_and_creates_order(self):
+        cpu = make_item(self.category, self.manager, stock=5)
+        gpu = make_item(self.category, self.manager, stock=2, name='RX 6650 XT', price=300)
+        CartLine.objects.create(cart=self.cart, item=cpu, quantity=2)
+        CartLine.objects.create(cart=self.cart, item=gpu, quantity=2)
+
+        order = self.cart.checkout()
+
+        cpu.refresh_from_db()
+        gpu.refresh_from_db()
+        self.assertEqual((cpu.stock, cpu.is_sold), (3, False))
+        self.assertEqual((gpu.stock, gpu.is_sold), (0, True))
+        self.assertEqual(order.sub_total, 800)
+        self.assertEqual(order.lines.count(), 2)
+        self.assertFalse(self.cart.lines.exists())
+
+        self.category.refresh_from_db()
+        self.assertEqual((self.category.item_count, self.category.available_count), (2, 1))
+
+    def test_checkout_is_all_or_nothing(self):
+        cpu = make_item(self.category, self.manager, stock=5)
+        gpu = make_item(self.category, self.manager, stock=1, name='RX 6650 XT')
+        CartLine.objects.create(cart=self.cart, item=cpu, quantity=2)
+        CartLine.objects.create(cart=self.cart, item=gpu, quantity=3)
+
+        with self.assertRaises(OutOfStock) as raised:
+            self.cart.checkout()
+
+        self.assertEqual(raised.exception.item, gpu)
+        cpu.refresh_from_db()
+        self.assertEqual(cpu.stock, 5) # the first line's reservation was rolled back
+        self.assertEqual(self.cart.lines.count(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_saving_other_fields_keeps_checked_out_stock(self):
+        cpu = make_item(self.category, self.manager, stock=1)
+        stale = Item.objects.get(pk=cpu.pk)
+        CartLine.objects.create(cart=self.cart, item=cpu, quantity=1)
+        self.cart.checkout()
+
+        stale.name = 'Ryzen 5 7600X (boxed)'
+        stale.save(update_fields=['name'])
+
+        cpu.refresh_from_db()
+        self.assertEqual((cpu.stock, cpu.is_sold), (0, True))
+
+
+class CartViewTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        manager = User.objects.create_user(username='manager', is_inventoryManager=True)
+        self.customer = User.objects.create_user(username='customer', password='pass', is_customer=True)
+        category = Category.objects.create(name='CPU')
+        self.cpu = make_item(category, manager, stock=2)
+        self.gpu = make_item(category, manager, stock=5, name='RX 6650 XT', price=300)
+
+    def visit(self, view, item):
+        response = self.client.get(reverse(f'dashboard:{view}', args=[item.pk]))
+        self.assertRedirects(response, reverse('dashboard:cart'))
+
+    def quantities(self, cart):
+        return dict(cart.lines.values_list('item_id', 'quantity'))
+
+    def test_quantities_stay_between_one_and_the_stock(self):
+        self.client.login(username='customer', password='pass')
+        self.visit('add_to_cart', self.cpu)
+        cart = Cart.objects.get(user=self.customer)
+        self.visit('add_to_cart', self.cpu) # already in the cart, one more
+        self.visit('increase_quantity', self.cpu) # only 2 in stock
+        self.assertEqual(self.quantities(cart), {self.cpu.pk: 2})
+
+        self.visit('decrease_quantity', self.cpu)
+        self.visit('decrease_quantity', self.cpu) # never below 1
+        self.assertEqual(self.quantities(cart), {self.cpu.pk: 1})
+
+        self.visit('remove_from_cart', self.cpu)
+        self.assertEqual(self.quantities(cart), {})
+
+    def test_anonymous_cart_is_kept_in_the_session(self):
+        self.visit('add_to_cart', self.cpu)
+        self.visit('add_to_cart', self.cpu)
+        cart = Cart.objects.get()
+        self.assertIsNone(cart.user)
+        self.assertEqual(self.client.session['cart_id'], cart.pk)
+        self.assertEqual(cart.session_key, self.client.session.session_key)
+        self.assertEqual(self.quantities(cart), {self.cpu.pk: 2})
+
+        other = self.client_class()
+        other.get(reverse('dashboard:remove_from_cart', args=[self.cpu.pk])) # someone else's session, no cart
+        self.assertEqual(self.quantities(cart), {self.cpu.pk: 2})
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        user_cart = Cart.objects.create(user=self.customer)
+        CartLine.objects.create(cart=user_cart, item=self.gpu, quantity=2)
+        self.visit('add_to_cart', self.cpu)
+        self.visit('add_to_cart', self.gpu)
+
+        self.client.login(username='customer', password='pass')
+
+        self.assertEqual(Cart.objects.get().pk, user_cart.pk) # the anonymous cart is gone
+        self.assertEqual(self.quantities(user_cart), {self.cpu.pk: 1, self.gpu.pk: 3})
+        self.assertNotIn('cart_id', self.client.session)
+
+    def test_sold_out_items_cannot_be_added(self):
+        self.gpu.stock = 0
+        self.gpu.save()
+        response = self.client.get(reverse('dashboard:add_to_cart', args=[self.gpu.pk]), follow=True)
+        self.assertContains(response, 'RX 6650 XT is sold out')
+        self.assertFalse(CartLine.objects.exists())
+
+    def test_merged_quantities_stay_within_the_stock(self):
+        user_cart = Cart.objects.create(user=self.customer)
+        CartLine.objects.create(cart=user_cart, item=self.cpu, quantity=2)
+        self.visit('add_to_cart', self.cpu) # 2 + 1 of the 2 in stock
+
+        self.client.login(username='customer', password='pass')
+
+        self.assertEqual(self.quantities(user_cart), {self.cpu.pk: 2})
+
+    def test_checkout_is_post_only(self):
+        self.client.login(username='customer', password='pass')
+        self.visit('add_to_cart', self.cpu)
+        self.assertEqual(self.client.get(reverse('dashboard:checkout')).status_code, 405)
+        self.assertFalse(Order.objects.exists())
+
+        self.assertRedirects(self.client.post(reverse('dashboard:checkout')), reverse('dashboard:cart'))
+        self.cpu.refresh_from_db()
+        self.assertEqual((self.cpu.stock, Order.objects.get().user), (1, self.customer))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    databases = '__all__' # outside a transaction the item reads may go to a read replica (core/routers.py)
+    BUYERS = 8
+    STOCK = 3
+
+    def setUp(self):
+        User = get_user_model()
+        manager = User.objects.create_user(username='manager', is_inventoryManager=True)
+        self.item = make_item(Category.objects.create(name='GPU'), manager, stock=self.STOCK)
+        self.carts = []
+        for i in range(self.BUYERS):
+            cart = Cart.objects.create(user=User.objects.create_user(username=f'buyer{i}', is_customer=True))
+            CartLine.objects.create(cart=cart, item=self.item, quantity=1)
+            self.carts.append(cart)
+
+    def test_concurrent_buyers_never_oversell_a_hot_item(self):
+        results = []
+        start = threading.Barrier(self.BUYERS)
+
+        def buy(cart):
+            try:
+                start.wait()
+                cart.checkout()
+                results.append('bought')
+            except OutOfStock:
+                results.append('out of stock')
+            except OperationalError:
+                # SQLite locks the whole database instead of rows, so some buyers just get "database is locked"
+                results.append('locked')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in self.carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.item.refresh_from_db()
+        bought = results.count('bought')
+        self.assertEqual(len(results), self.BUYERS)
+        self.assertLessEqual(bought, self.STOCK)
+        self.assertEqual(self.item.stock, self.STOCK - bought)
+        self.assertEqual(Order.objects.count(), bought)
+        self.assertEqual(self.item.is_sold, self.item.stock == 0)
+        if connection.vendor == 'postgresql':
+            # Row locks queue the buyers up: exactly the available units are sold, everyone else is told it's gone
+            self.assertEqual(bought, self.STOCK)
+            self.assertEqual(results.count('out of stock'), self.BUYERS - self.STOCK)
+
+    def test_carts_with_the_same_items_in_any_order_do_not_deadlock(self):
+        other = make_item(Category.objects.get(name='GPU'), self.item.created_by, stock=self.BUYERS, name='RX 6950 XT')
+        # Half the carts add the items the other way around
+        for i, cart in enumerate(self.carts):
+            if i % 2:
+                CartLine.objects.filter(cart=cart).delete()
+                CartLine.objects.create(cart=cart, item=other, quantity=1)
+                CartLine.objects.create(cart=cart, item=self.item, quantity=1)
+            else:
+                CartLine.objects.create(cart=cart, item=other, quantity=1)
+
+        errors = []
+        start = threading.Barrier(self.BUYERS)
+
+        def buy(cart):
+            try:
+                start.wait()
+                cart.checkout()
+            except OutOfStock:
+                pass
+            except OperationalError as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in self.carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        bought = Order.objects.count()
+        self.item.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.item.stock, self.STOCK - bought)
+        self.assertEqual(other.stock, self.BUYERS - bought)
+        if connection.vendor == 'postgresql':
+            self.assertEqual(errors, []) # a deadlock would surface as an OperationalError
+            self.assertEqual(bought, self.STOCK)
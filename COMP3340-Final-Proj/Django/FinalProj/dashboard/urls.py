@@ -11,4 +11,5 @@ urlpatterns = [
     path('remove_from_cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('increase_quantity/<int:item_id>/', views.increase_quantity, name='increase_quantity'),
     path('decrease_quantity/<int:item_id>/', views.decrease_quantity, name='decrease_quantity'),
+    path('checkout/', views.checkout, name='checkout'),
 ]
@@ -2,114 +2,109 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect, reverse
 
 from item.models import Item, Images
-from django.core.paginator import Paginator
+from .models import TAX_RATE, Cart, CartLine, OutOfStock
+from django.contrib import messages
+from django.views.decorators.http import require_POST
+from django.db.models import F
+from item.pagination import CursorPaginator
 from django.http import JsonResponse
 
 # This is for clicking on the dashboard button and displaying the items that the User has added
 @login_required
 def index(request):
-    items = Item.objects.filter(created_by=request.user)
-    p = Paginator(items, 6)
-    page = request.GET.get('page')
-    items_list = p.get_page(page)
-
-    numPages = "a" * items_list.paginator.num_pages
+    items = Item.objects.filter(created_by=request.user).prefetch_related('images')
+    p = CursorPaginator(items, 6) # newest first, paged by (created_at, id) cursor
+    items_list = p.get_page(request.GET.get('cursor'))
 
     return render(request, 'dashboard/index.html', {
         'items': items_list,
-        'numPages': numPages
     })
 
+# Helper function to get (or create) the cart of the current visitor.
+# Logged in users have one cart each, anonymous visitors get one whose id is kept in their session.
+def get_user_cart(request, create=False):
+    if request.user.is_authenticated:
+        if create:
+            return Cart.objects.get_or_create(user=request.user)[0]
+        return Cart.objects.filter(user=request.user).first()
+
+    cart = None
+    cart_id = request.session.get('cart_id')
+    if cart_id is not None:
+        cart = Cart.objects.filter(pk=cart_id, user=None).first()
+    if cart is None and create:
+        if request.session.session_key is None:
+            request.session.save() # gives the session its key
+        cart = Cart.objects.create(session_key=request.session.session_key)
+        request.session['cart_id'] = cart.id
+    return cart
+
 def cart(request):
-    cart_items = request.session.get('cart', [])
-    
-    sub_total_price = sum(item['price'] * item['quantity'] for item in cart_items)
-    tax = sub_total_price*0.13
+    user_cart = get_user_cart(request)
+    cart_items = []
+    if user_cart is not None:
+        cart_items = list(user_cart.lines.select_related('item').prefetch_related('item__images'))
+
+    sub_total_price = sum(line.total for line in cart_items)
+    tax = sub_total_price*TAX_RATE
     total = sub_total_price+tax
 
     return render(request, 'dashboard/cart.html', {'cart_items': cart_items, 'sub_total': sub_total_price, 'tax': tax, 'total': total})
 
 def add_to_cart(request, item_id):
-    # Get the item
-    item = get_object_or_404(Item, id=item_id)
-
-    # Get the user's cart from the session
-    cart = request.session.get('cart', [])
-
-    # Check if the item is already in the cart
-    item_in_cart = next((cart_item for cart_item in cart if cart_item['id'] == item.id), None)
-
-    if item_in_cart:
-        # If the item is already in the cart, update the quantity
-        item_in_cart['quantity'] += 1
-        item_in_cart['total'] = item_in_cart['quantity'] * item.price
-    else:
-        # If the item is not in the cart, add it with a default quantity of 1
-        first_image = item.images.first()
-        image_url = first_image.image.url if first_image else None
-        cart_item = {
-            'id': item.id,
-            'image': image_url,  # Add the image URL
-            'name': item.name,
-            'price': item.price,
-            'quantity': 1,
-            'total': item.price * 1,  # Initial total calculation
-            'stock': item.stock #total stock of that item
-        }
-
-        cart.append(cart_item)
-
-    # Update the session with the modified cart
-    request.session['cart'] = cart
+    # Make sure the item exists, and that there is some of it left
+    item = get_object_or_404(Item.objects.only('id', 'name', 'stock', 'is_sold'), id=item_id)
+    if item.is_sold or item.stock == 0:
+        messages.error(request, f"Sorry, {item.name} is sold out.")
+        return redirect(reverse('dashboard:cart'))
+    user_cart = get_user_cart(request, create=True)
+
+    # If the item is already in the cart, add one (as long as there is stock for it), otherwise add a new line
+    lines = CartLine.objects.filter(cart=user_cart, item=item)
+    if not lines.filter(quantity__lt=F('item__stock')).update(quantity=F('quantity') + 1):
+        CartLine.objects.get_or_create(cart=user_cart, item=item)
 
     # Redirect to the cart page
     return redirect(reverse('dashboard:cart'))
 
 def remove_from_cart(request, item_id):
-    # Get the user's cart from the session
-    cart = request.session.get('cart', [])
+    user_cart = get_user_cart(request)
 
-    # Check if the item is in the cart
-    cart_item = next((item for item in cart if item['id'] == item_id), None)
-
-    if cart_item:
-        # If the item is in the cart, remove it
-        cart.remove(cart_item)
-        request.session['cart'] = cart
+    if user_cart is not None:
+        CartLine.objects.filter(cart=user_cart, item_id=item_id).delete()
 
     # Redirect back to the cart page
     return redirect(reverse('dashboard:cart'))
 
-# Helper function to get or create the user's cart
-def get_user_cart(request):
-    if 'cart' not in request.session:
-        request.session['cart'] = []
-    return request.session['cart']
-
 def increase_quantity(request, item_id):
-    cart = get_user_cart(request)
-    cart_item = next((item for item in cart if item['id'] == item_id), None)
+    user_cart = get_user_cart(request)
 
-    if cart_item and cart_item['quantity'] < cart_item['stock']:  # Assuming 'stock' is the available quantity
-        cart_item['quantity'] += 1
-        cart_item['total'] = cart_item['quantity'] * cart_item['price']
+    # Only goes up while there is enough stock of the item
+    if user_cart is not None:
+        CartLine.objects.filter(cart=user_cart, item_id=item_id, quantity__lt=F('item__stock')).update(quantity=F('quantity') + 1)
 
-    # Update the session with the modified cart
-    request.session['cart'] = cart
-
-    # Return JSON response with updated totals
     return redirect('dashboard:cart')
 
 def decrease_quantity(request, item_id):
-    cart = get_user_cart(request)
-    cart_item = next((item for item in cart if item['id'] == item_id), None)
+    user_cart = get_user_cart(request)
+
+    if user_cart is not None:
+        CartLine.objects.filter(cart=user_cart, item_id=item_id, quantity__gt=1).update(quantity=F('quantity') - 1)
 
-    if cart_item and cart_item['quantity'] > 1:
-        cart_item['quantity'] -= 1
-        cart_item['total'] = cart_item['quantity'] * cart_item['price']
+    return redirect('dashboard:cart')
 
-    # Update the session with the modified cart
-    request.session['cart'] = cart
+@require_POST
+def checkout(request):
+    user_cart = get_user_cart(request)
+    if user_cart is None:
+        return redirect('dashboard:cart')
 
-    # Return JSON response with updated totals
-    return redirect('dashboard:cart')
\ No newline at end of file
+    try:
+        order = user_cart.checkout()
+    except OutOfStock as e:
+        messages.error(request, f"Sorry, there isn't enough stock left of {e.item.name}. Please update your cart.")
+        return redirect('dashboard:cart')
+
+    if order is not None:
+        messages.success(request, f"Thank you! Your order #{order.id} for ${order.total:.2f} has been placed.")
+    return redirect('dashboard:cart')
@@ -0,0 +1,137 @@
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from core.page_cache import tag_page
+
+from .conditional import api_items_etag, api_items_last_modified, valid_categories
+from .facets import browse_facets
+from .models import Category, Images, Item
+from .pagination import CursorPaginator
+from .search import filter_items, filter_params, sort_ordering
+from .suggest import suggestions
+from .thumbnails import thumbnail_name
+
+# Read-only JSON API for the catalog, for the browse page's JavaScript and anyone else who wants the items
+# without scraping HTML.
+#
+#   GET /items/api/items/?query=ryzen&category=1&category=2&min_price=100&max_price=250&sort=price_asc
+#                         &fields=id,name,price&limit=24&cursor=...
+#   GET /items/api/categories/
+#   GET /items/suggest/?q=ryz&limit=8
+#
+# Rows are read with .values() (no model instances) and only the requested columns are selected.
+
+# API field -> what is selected for it (None for fields computed from other columns)
+ITEM_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'price': 'price',
+    'stock': 'stock',
+    'category': 'category_id',
+    'category_name': 'category__name',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'url': None,
+    'image': None,
+}
+DEFAULT_ITEM_FIELDS = ['id', 'name', 'price', 'stock', 'category', 'url', 'image']
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+JSON_OPTIONS = {'separators': (',', ':')} # no whitespace
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def first_image_urls(item_ids):
+    # The card sized image of each item, for the whole page in one query (the lowest id is the first image)
+    storage = Images._meta.get_field('image').storage
+    urls = {}
+    for item_id, name, has_thumbnails in (
+        Images.objects.filter(item_id__in=item_ids).order_by('item_id', 'id').values_list('item_id', 'image', 'has_thumbnails')
+    ):
+        if item_id not in urls and name:
+            urls[item_id] = storage.url(thumbnail_name(name, 'card') if has_thumbnails else name)
+    return urls
+
+
+@require_GET
+@condition(etag_func=api_items_etag, last_modified_func=api_items_last_modified)
+def items(request):
+    query, selected_categories, price = filter_params(request.GET)
+
+    fields = request.GET.get('fields')
+    fields = [field for field in fields.split(',') if field] if fields else DEFAULT_ITEM_FIELDS
+    unknown = [field for field in fields if field not in ITEM_FIELDS]
+    if unknown:
+        return error('Unknown field(s): %s. Available: %s' % (', '.join(unknown), ', '.join(ITEM_FIELDS)))
+    try:
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        return error('limit must be a number')
+    if not valid_categories(selected_categories):
+        return error('category must be a category id')
+
+    with_facets = request.GET.get('facets', '1') != '0'
+    # See core/page_cache.py. The facets count the items of every category, not only the selected ones.
+    tag_page(request, *([f'category:{pk}' for pk in selected_categories] if selected_categories and not with_facets else ['items']))
+
+    items = filter_items(Item.objects.filter(is_sold=False), query, selected_categories, price)
+    paginator = CursorPaginator(items, limit, ordering=sort_ordering(request.GET))
+    # The columns the cursor is made of are selected too, even if they weren't asked for
+    columns = {ITEM_FIELDS[field] for field in fields if ITEM_FIELDS[field]} | {'id'} | {field for field, _ in paginator.fields}
+    paginator.object_list = items.values(*columns)
+    page = paginator.get_page(request.GET.get('cursor'))
+
+    rows = page.object_list
+    images = first_image_urls([row['id'] for row in rows]) if 'image' in fields else {}
+    results = []
+    for row in rows:
+        result = {}
+        for field in fields:
+            if field == 'url':
+                result[field] = reverse('item:detail', args=[row['id']])
+            elif field == 'image':
+                result[field] = images.get(row['id'])
+            else:
+                result[field] = row[ITEM_FIELDS[field]]
+        results.append(result)
+
+    data = {
+        'results': results,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
+    if with_facets:
+        data['facets'] = browse_facets(query, selected_categories, price) # see item/facets.py
+    return JsonResponse(data, json_dumps_params=JSON_OPTIONS)
+
+
+@require_GET
+def categories(request):
+    tag_page(request, 'categories', 'items') # the counters change with the items
+    data = {'results': list(Category.objects.values('id', 'name', 'item_count', 'available_count'))}
+    return JsonResponse(data, json_dumps_params=JSON_OPTIONS)
+
+
+@require_GET
+def suggest(request):
+    # Answered from the in-process prefix index, no database query once it is built
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        return error('limit must be a number')
+    found = suggestions(request.GET.get('q', ''), limit)
+    browse = reverse('item:browse')
+    data = {
+        'items': [{'id': pk, 'name': name, 'url': reverse('item:detail', args=[pk])} for pk, name in found['item']],
+        'categories': [{'id': pk, 'name': name, 'url': f'{browse}?category={pk}'} for pk, name in found['category']],
+    }
+    response = JsonResponse(data, json_dumps_params=JSON_OPTIONS)
+    patch_cache_control(response, public=True, max_age=60) # the browser (or a proxy) answers repeated keystrokes
+    return response
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def setup_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from .search import install_sqlite_fts
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        install_sqlite_fts(connection)
 
 
 class ItemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'item'
+
+    def ready(self):
+        from core.blobs import track
+        from . import signals # noqa: F401, registers the receivers
+        from .models import Images
+
+        track(Images, 'image') # reference counts of the uploaded files, see core/blobs.py
+        post_migrate.connect(setup_search_index, sender=self)
@@ -0,0 +1,45 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.page_cache import purge
+
+# Rendered catalog fragments (item grids, category lists, browse AJAX responses) are cached under keys
+# that contain a catalog version number. Any change to an Item, Images or Category bumps the version
+# (see item/signals.py), so old entries are simply never looked up again and expire on their own.
+
+VERSION_KEY = 'catalog:version'
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1, so a version key that was evicted from the cache
+        # can't come back with a number that older fragments were stored under
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError: # the key isn't in the cache
+        cache.set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def catalog_cache_key(prefix, *parts):
+    raw = '|'.join(str(part) for part in parts)
+    return 'catalog:%s:%s:%s' % (prefix, catalog_version(), hashlib.md5(raw.encode()).hexdigest())
+
+
+def cache_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+
+
+def purge_item_pages(item_ids=(), category_ids=()):
+    # Purges the anonymous full-page cache (core/page_cache.py) for these items and categories,
+    # and the pages listing every category (front page, browse) which show them too
+    purge('items', *(f'item:{pk}' for pk in item_ids), *(f'category:{pk}' for pk in category_ids if pk is not None))
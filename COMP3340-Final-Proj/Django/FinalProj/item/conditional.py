@@ -0,0 +1,90 @@
+import hashlib
+
+from django.db.models import Count, Max, Q, Subquery
+
+from .cache import catalog_version
+from .models import Item
+from .pagination import page_query
+from .search import filter_items, filter_params
+
+# ETag/Last-Modified validators for django.views.decorators.http.condition(), so a client that already has
+# the page gets a 304 without the view running or a template being rendered.
+# Each page's validators come from one aggregate query over the items it shows: the newest updated_at
+# (see Item.updated_at) and how many there are, so an item dropping out of the page changes them as well.
+# The ETag also contains the user, since the pages look different to each of them.
+# The browse JSON and the API also carry the facets (item/facets.py), which count items outside the filters
+# too (sold ones, other prices), so their ETags also contain the catalog version (item/cache.py) that any
+# change to the catalog bumps.
+
+
+def _validators(request, items, *parts):
+    # Memoised on the request: condition() asks for the ETag and the Last-Modified separately
+    if not hasattr(request, 'page_validators'):
+        stats = items.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+        if stats['count']:
+            raw = '|'.join(str(part) for part in [*parts, stats['last_modified'].isoformat(), stats['count'], request.user.pk])
+            request.page_validators = (hashlib.md5(raw.encode()).hexdigest(), stats['last_modified'])
+        else:
+            request.page_validators = (None, None) # nothing to show, let the view answer (e.g. with a 404)
+    return request.page_validators
+
+
+def valid_categories(selected_categories):
+    # Runs before the view, which reports bad ids itself, so the validators must not query with them
+    return all(pk.isdigit() for pk in selected_categories)
+
+
+def detail_items(pk):
+    # The item and the unsold items of its category, which the related items are picked from.
+    # The category comes from a subquery on the primary key, a join through the category would repeat the
+    # item once for every item in it.
+    category_id = Item.objects.filter(pk=pk).values('category_id')
+    return Item.objects.filter(Q(pk=pk) | Q(category_id=Subquery(category_id), is_sold=False))
+
+
+def detail_validators(request, pk):
+    return _validators(request, detail_items(pk), 'detail', pk)
+
+
+def detail_etag(request, pk):
+    return detail_validators(request, pk)[0]
+
+
+def detail_last_modified(request, pk):
+    return detail_validators(request, pk)[1]
+
+
+def browse_validators(request):
+    # Only for the AJAX requests, which return the items matching the filters as JSON
+    if request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+        return None, None
+    params = filter_params(request.GET)
+    if not valid_categories(params[1]):
+        return None, None
+    items = filter_items(Item.objects.filter(is_sold=False), *params)
+    return _validators(request, items, 'browse', page_query(request), request.GET.get('cursor'), catalog_version())
+
+
+def browse_etag(request):
+    return browse_validators(request)[0]
+
+
+def browse_last_modified(request):
+    return browse_validators(request)[1]
+
+
+def api_items_validators(request):
+    # The JSON API (item/api.py), the same items as browse but the whole query string picks the page and fields
+    params = filter_params(request.GET)
+    if not valid_categories(params[1]):
+        return None, None # the view answers with a 400
+    items = filter_items(Item.objects.filter(is_sold=False), *params)
+    return _validators(request, items, 'api', request.GET.urlencode(), catalog_version())
+
+
+def api_items_etag(request):
+    return api_items_validators(request)[0]
+
+
+def api_items_last_modified(request):
+    return api_items_validators(request)[1]
@@ -0,0 +1,42 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+# Category.item_count / Category.available_count are denormalized so the front page doesn't
+# have to COUNT every category's items. They're kept up to date by Item.save() and the
+# post_delete signal in item/signals.py, and `manage.py reconcile_category_counts` fixes any drift
+# (e.g. after queryset.update() or bulk_create(), which skip both).
+
+
+def adjust_category_counts(category_id, total=0, available=0):
+    from .models import Category
+
+    if not (total or available):
+        return
+    Category.objects.filter(pk=category_id).update(
+        item_count=Greatest(F('item_count') + total, Value(0)),
+        available_count=Greatest(F('available_count') + available, Value(0)),
+    )
+
+
+def move_item_counts(old, new):
+    # old/new are (category_id, is_sold) before and after a change, None if the item didn't/doesn't exist
+    if old == new:
+        return
+    if old is not None:
+        adjust_category_counts(old[0], total=-1, available=0 if old[1] else -1)
+    if new is not None:
+        adjust_category_counts(new[0], total=1, available=0 if new[1] else 1)
+
+
+def reconcile_category_counts(categories=None):
+    # Recounts from the item table in a single UPDATE, returns how many categories were updated
+    from .models import Category, Item
+
+    if categories is None:
+        categories = Category.objects.all()
+
+    def count_items(condition=Q()):
+        counts = Item.objects.filter(condition, category=OuterRef('pk')).order_by().values('category')
+        return Coalesce(Subquery(counts.annotate(n=Count('id')).values('n')), Value(0))
+
+    return categories.update(item_count=count_items(), available_count=count_items(Q(is_sold=False)))
@@ -0,0 +1,49 @@
+import csv
+import zlib
+
+# Columns of the item CSV export, and the queryset fields each one comes from.
+# category and created_by are joined in the same query instead of being loaded per row.
+EXPORT_COLUMNS = [
+    ('ID', 'id'),
+    ('Category', 'category__name'),
+    ('Name', 'name'),
+    ('Description', 'description'),
+    ('Price', 'price'),
+    ('Is Sold', 'is_sold'),
+    ('Stock', 'stock'),
+    ('Created By', 'created_by__username'),
+    ('Created At', 'created_at'),
+]
+
+ROWS_PER_CHUNK = 500 # rows joined into each chunk sent to the client
+ITERATOR_CHUNK_SIZE = 2000 # rows fetched per round trip from the (server-side) cursor
+
+
+class Echo:
+    # csv.writer wants a file, this one just hands back what was written (from the Django docs on streaming CSV)
+    def write(self, value):
+        return value
+
+
+def csv_chunks(items):
+    # Yields the export as text chunks without ever holding more than ROWS_PER_CHUNK rows in memory
+    writer = csv.writer(Echo())
+    rows = items.values_list(*[field for column, field in EXPORT_COLUMNS]).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+    chunk = [writer.writerow([column for column, field in EXPORT_COLUMNS])]
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) # 16+ gives a gzip header instead of a raw zlib stream
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
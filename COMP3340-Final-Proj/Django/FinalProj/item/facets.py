@@ -0,0 +1,69 @@
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache import cache_timeout, catalog_cache_key
+from .models import Item
+from .search import filter_items, price_filter
+
+# Facets for the browse page and the JSON API: for the current search, how many results each category
+# would give, a price histogram and how many are in stock.
+# Everything comes from ONE grouped query over the items matching the search (GROUP BY category, with a
+# filtered COUNT per price bucket), and the rows are cached per search/price range, so toggling categories
+# on and off is worked out from the cached rows without touching the database.
+# As usual for facets, each one ignores its own filter: the category counts ignore the selected categories
+# and the price histogram ignores the selected price range.
+
+PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000, 2000] # lower bounds, the last bucket is open ended
+
+
+def bucket_bounds():
+    return list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None]))
+
+
+def facet_rows(query, price):
+    # [(category_id, category_name, unsold in price range, sold in price range, [unsold per price bucket])]
+    key = catalog_cache_key('facets', query, price)
+    rows = cache.get(key)
+    if rows is not None:
+        return rows
+
+    in_price = price_filter(price)
+    buckets = {
+        f'bucket{i}': Count('id', filter=Q(is_sold=False, price__gte=low, **({'price__lt': high} if high is not None else {})))
+        for i, (low, high) in enumerate(bucket_bounds())
+    }
+    grouped = (
+        filter_items(Item.objects.all(), query, [])
+        .order_by()
+        .values('category_id', 'category__name')
+        .annotate(
+            available=Count('id', filter=Q(is_sold=False) & in_price),
+            sold=Count('id', filter=Q(is_sold=True) & in_price),
+            **buckets,
+        )
+    )
+    rows = [
+        (row['category_id'], row['category__name'], row['available'], row['sold'], [row[name] for name in buckets])
+        for row in grouped
+    ]
+    cache.set(key, rows, cache_timeout())
+    return rows
+
+
+def browse_facets(query, selected_categories, price):
+    selected = {int(pk) for pk in selected_categories}
+    rows = facet_rows(query, price)
+    in_selection = [row for row in rows if not selected or row[0] in selected]
+
+    return {
+        'categories': sorted(
+            ({'id': pk, 'name': name, 'count': available} for pk, name, available, sold, buckets in rows if available),
+            key=lambda facet: facet['name'],
+        ),
+        'price': [
+            {'min': low, 'max': high, 'count': sum(row[4][i] for row in in_selection)}
+            for i, (low, high) in enumerate(bucket_bounds())
+        ],
+        'in_stock': sum(row[2] for row in in_selection),
+        'out_of_stock': sum(row[3] for row in in_selection),
+    }
@@ -52,3 +52,12 @@ class EditItemForm(forms.ModelForm):
                 'class': 'w-full py-4 px-6 rounded-xl border'
             }),
         }
+
+
+class ImportItemsForm(forms.Form):
+    file = forms.FileField(
+        help_text='A .csv file with the columns of the CSV export, or a .jsonl file with one item per line. Rows with an ID update that item.',
+        widget=forms.ClearableFileInput(attrs={'accept': '.csv,.jsonl,.ndjson'}),
+    )
+    create_categories = forms.BooleanField(required=False, label='Create missing categories')
+    dry_run = forms.BooleanField(required=False, label='Only check the file')
@@ -0,0 +1,197 @@
+import csv
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import suggest
+from .cache import bump_catalog_version, purge_item_pages
+from .counters import reconcile_category_counts
+from .export import EXPORT_COLUMNS
+from .models import Category, Item
+
+# Bulk import of items, the other direction of the CSV export (item/export.py): the same columns, as CSV
+# or as JSON Lines (one object per line with the same keys). Used by the import view and `manage.py import_items`.
+#
+# A row with an ID updates that item, a row without one creates an item. Is Sold follows the stock like in
+# Item.save(), and Created At can't be imported. Rows are read and validated BATCH_SIZE at a time, the
+# categories and users of a batch are looked up with one query each, and each batch is written with
+# bulk_create()/bulk_update() in its own transaction. A bad row is reported with its line number and skipped.
+# bulk_create()/bulk_update() skip Item.save() and the signals, so the counters, the catalog cache, the
+# cached pages and the autocomplete index are brought up to date once at the end, also when the import stops
+# halfway with an error (the batches written before it stay).
+# A file that isn't UTF-8 text is reported as an error on the line the reading stopped at, the rows before it
+# are still imported.
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+COLUMNS = {field: column for column, field in EXPORT_COLUMNS} # field -> column in the file
+EDITABLE_FIELDS = ['name', 'description', 'price', 'stock']
+UPDATED_FIELDS = ['category', 'created_by', *EDITABLE_FIELDS, 'is_sold', 'updated_at']
+FORM_FIELDS = {field: Item._meta.get_field(field).formfield() for field in EDITABLE_FIELDS} # the validation of NewItemForm
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = [] # (line number, message), the first MAX_REPORTED_ERRORS of them
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def read_rows(file, format):
+    # Yields (line number, {column: value}) from a text file, or (line number, exception) for a bad line
+    line = 0
+    try:
+        if format == 'jsonl':
+            for line, text in enumerate(file, 1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError as e:
+                    yield line, e
+                    continue
+                yield line, row if isinstance(row, dict) else ValueError('not a JSON object')
+        else:
+            reader = csv.DictReader(file)
+            for row in reader:
+                line = reader.line_num
+                yield line, row
+    except UnicodeDecodeError: # the file is decoded a chunk at a time, so this is as close as it gets
+        yield line + 1, ValueError('the file is not UTF-8 text, the rest of it was skipped')
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Lookups:
+    # name -> id for the categories and users named in the file, each batch only queries the names it hasn't seen yet
+    def __init__(self, create_categories=False, dry_run=False):
+        self.categories = {}
+        self.users = {}
+        self.create_categories = create_categories
+        self.dry_run = dry_run
+
+    def load(self, rows):
+        category_names = {str(row.get('Category') or '').strip() for line, row in rows} - {''} - self.categories.keys()
+        usernames = {str(row.get('Created By') or '').strip() for line, row in rows} - {''} - self.users.keys()
+        if category_names:
+            self.categories.update(Category.objects.filter(name__in=category_names).values_list('name', 'id'))
+            missing = category_names - self.categories.keys()
+            if missing and self.create_categories and self.dry_run:
+                self.categories.update(dict.fromkeys(missing)) # would be created
+            elif missing and self.create_categories:
+                created = Category.objects.bulk_create([Category(name=name) for name in sorted(missing)])
+                self.categories.update((category.name, category.pk) for category in created)
+        if usernames:
+            self.users.update(get_user_model().objects.filter(username__in=usernames).values_list('username', 'id'))
+
+
+def clean_row(row, lookups):
+    # {field: value} for an Item, raises ValidationError with every problem in the row
+    errors, values = [], {}
+    for field, form_field in FORM_FIELDS.items():
+        raw = row.get(COLUMNS[field])
+        try:
+            values[field] = form_field.clean('' if raw is None else str(raw).strip())
+        except ValidationError as e:
+            errors.append('%s: %s' % (field, ' '.join(e.messages)))
+
+    category = str(row.get('Category') or '').strip()
+    if category not in lookups.categories:
+        errors.append('category: %s' % (f'no category named "{category}"' if category else 'this field is required'))
+    else:
+        values['category_id'] = lookups.categories[category]
+
+    username = str(row.get('Created By') or '').strip() # left as it is when updating, the importing user when creating
+    if username and username not in lookups.users:
+        errors.append(f'created_by: no user named "{username}"')
+    elif username:
+        values['created_by_id'] = lookups.users[username]
+
+    if errors:
+        raise ValidationError(errors)
+    values['is_sold'] = values['stock'] == 0 # like Item.save()
+    return values
+
+
+def item_id(row):
+    raw = str(row.get('ID') or '').strip()
+    if not raw:
+        return None
+    if not raw.isdigit():
+        raise ValidationError(f'id: "{raw}" is not an item id')
+    return int(raw)
+
+
+def import_items(file, format, user, create_categories=False, dry_run=False, batch_size=BATCH_SIZE):
+    result = ImportResult()
+    lookups = Lookups(create_categories, dry_run)
+    changed_ids, category_ids = [], set()
+
+    try:
+        for batch in batches(read_rows(file, format), batch_size):
+            rows = []
+            for line, row in batch:
+                if isinstance(row, Exception):
+                    result.error(line, str(row))
+                else:
+                    rows.append((line, row))
+            lookups.load(rows)
+
+            parsed = []
+            for line, row in rows:
+                try:
+                    parsed.append((line, item_id(row), clean_row(row, lookups)))
+                except ValidationError as e:
+                    result.error(line, '; '.join(e.messages))
+            existing = Item.objects.in_bulk([pk for line, pk, values in parsed if pk is not None])
+
+            to_create, to_update = [], []
+            now = timezone.now()
+            for line, pk, values in parsed:
+                if pk is None:
+                    to_create.append(Item(**{'created_by_id': user.pk, **values}))
+                elif pk in existing:
+                    item = existing[pk]
+                    category_ids.add(item.category_id) # it may be moved out of it
+                    for field, value in values.items():
+                        setattr(item, field, value)
+                    item.updated_at = now # bulk_update() doesn't apply auto_now
+                    to_update.append(item)
+                else:
+                    result.error(line, f'id: no item with id {pk}')
+                    continue
+                category_ids.add(values['category_id'])
+
+            if not dry_run:
+                with transaction.atomic():
+                    Item.objects.bulk_create(to_create)
+                    Item.objects.bulk_update(to_update, UPDATED_FIELDS)
+                changed_ids += [item.pk for item in to_update]
+            result.created += len(to_create)
+            result.updated += len(to_update)
+    finally: # the batches written before an error are imported too
+        if not dry_run and (result.created or result.updated):
+            reconcile_category_counts(Category.objects.filter(pk__in=category_ids))
+            bump_catalog_version()
+            purge_item_pages(changed_ids, category_ids) # new items have no cached pages of their own yet
+            suggest.index.invalidate()
+    return result
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from item.models import Images, Item
+from item.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Creates the resized copies (see item/thumbnails.py) for item images that were uploaded before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate the thumbnails of every image, not only the missing ones')
+
+    def handle(self, *args, **options):
+        images = Images.objects.exclude(image='')
+        if not options['force']:
+            images = images.filter(has_thumbnails=False)
+
+        done = failed = 0
+        for image in images.only('id', 'item_id', 'image').iterator(chunk_size=200):
+            if generate_thumbnails(image.image):
+                Images.objects.filter(pk=image.pk).update(has_thumbnails=True)
+                Item.objects.filter(pk=image.item_id).update(updated_at=timezone.now()) # the pages now link the thumbnails
+                done += 1
+            else:
+                failed += 1
+                self.stderr.write(f'Could not read {image.image.name}')
+
+        self.stdout.write(self.style.SUCCESS(f'Generated thumbnails for {done} image(s), {failed} failed'))
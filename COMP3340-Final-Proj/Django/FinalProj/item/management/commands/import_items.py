@@ -0,0 +1,44 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from item.imports import BATCH_SIZE, import_items
+
+
+class Command(BaseCommand):
+    help = 'Creates and updates items from a CSV file with the columns of the CSV export, or from a JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='.csv or .jsonl file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--user', required=True, help='Username new items are created by, unless a row has Created By')
+        parser.add_argument('--create-categories', action='store_true', help='Create categories that do not exist yet')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the rows')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user named "{options["user"]}"')
+        format = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        started = time.perf_counter()
+        with open(options['path'], newline='', encoding='utf-8-sig') as file:
+            result = import_items(
+                file, format, user,
+                create_categories=options['create_categories'], dry_run=options['dry_run'], batch_size=options['batch_size'],
+            )
+
+        for line, message in result.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more errors')
+
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        summary = f'{verb} {result.created} new and {result.updated} updated items in {time.perf_counter() - started:.1f}s'
+        if result.error_count:
+            self.stdout.write(self.style.WARNING(f'{summary}, {result.error_count} rows skipped'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from item.counters import reconcile_category_counts
+from item.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Recounts the total/available item counters stored on each Category and reports any that had drifted'
+
+    def handle(self, *args, **options):
+        def counts():
+            return {pk: (total, available) for pk, total, available in Category.objects.values_list('id', 'item_count', 'available_count')}
+
+        before = counts()
+        updated = reconcile_category_counts()
+        after = counts()
+
+        for pk, (total, available) in after.items():
+            if before.get(pk) != (total, available):
+                old_total, old_available = before.get(pk, (None, None))
+                self.stdout.write(f'Category {pk}: {old_total}/{old_available} -> {total}/{available} (total/available)')
+
+        self.stdout.write(self.style.SUCCESS(f'Recounted {updated} categories'))
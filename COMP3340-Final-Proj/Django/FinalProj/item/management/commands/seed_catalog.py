@@ -0,0 +1,140 @@
+import random
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+
+from core.blobs import reconcile_blob_references
+from core.image_metadata import image_metadata
+from dashboard.models import Cart, CartLine
+from item.cache import bump_catalog_version
+from item.counters import reconcile_category_counts
+from item.models import Category, Images, Item
+from item.thumbnails import generate_thumbnails
+
+# Everything this command creates is named with this prefix, so --clear can remove it again
+# without touching real items.
+PREFIX = 'seed'
+SEED_PASSWORD = 'seed-password'
+
+PRODUCTS = ['Ryzen', 'Core', 'GeForce', 'Radeon', 'Vengeance', 'Barracuda', 'WD Blue', 'ROG Strix', 'Noctua', 'Corsair RM']
+ADJECTIVES = ['fast', 'quiet', 'overclockable', 'low profile', 'RGB', 'compact', 'high end', 'budget', 'refurbished', 'boxed']
+COLOURS = ['#e74c3c', '#3498db', '#2ecc71', '#f1c40f', '#9b59b6', '#1abc9c', '#e67e22', '#34495e']
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a synthetic catalog (categories, items, images, users and carts) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--images-per-item', type=int, default=2)
+        parser.add_argument('--managers', type=int, default=10, help='Inventory managers the items are spread over')
+        parser.add_argument('--customers', type=int, default=100, help='Customers, each of them gets a cart')
+        parser.add_argument('--cart-lines', type=int, default=3, help='Items in each customer cart')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=3340, help='Random seed, the same seed gives the same catalog')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded data first')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        if options['clear']:
+            self.clear()
+
+        with transaction.atomic():
+            managers, customers = self.create_users(options['managers'], options['customers'])
+            categories = Category.objects.bulk_create(
+                [Category(name=f'{PREFIX} category {i}') for i in range(options['categories'])], batch_size=batch_size
+            )
+            self.stdout.write(f'Created {len(managers) + len(customers)} users and {len(categories)} categories')
+
+            items = self.create_items(options['items'], categories, managers, rng, batch_size)
+            self.create_images(items, options['images_per_item'], batch_size)
+            self.create_carts(customers, items, options['cart_lines'], rng, batch_size)
+
+            # bulk_create skips Item.save() and the signals, so the counters and the cached pages are brought up to date here
+            reconcile_category_counts(Category.objects.filter(pk__in=[category.pk for category in categories]))
+            transaction.on_commit(bump_catalog_version)
+
+        self.stdout.write(self.style.SUCCESS(f'Seeded {len(items)} items in {len(categories)} categories'))
+
+    def clear(self):
+        User = get_user_model()
+        # Items, images, carts and their lines cascade from the categories and users
+        Category.objects.filter(name__startswith=f'{PREFIX} ').delete()
+        User.objects.filter(username__startswith=f'{PREFIX}_').delete()
+        bump_catalog_version()
+        self.stdout.write('Removed previously seeded data')
+
+    def create_users(self, manager_count, customer_count):
+        User = get_user_model()
+        password = make_password(SEED_PASSWORD) # hashed once, hashing per user would take minutes
+        managers = User.objects.bulk_create([
+            User(username=f'{PREFIX}_manager{i}', password=password, is_inventoryManager=True)
+            for i in range(manager_count)
+        ])
+        customers = User.objects.bulk_create([
+            User(username=f'{PREFIX}_customer{i}', password=password, is_customer=True)
+            for i in range(customer_count)
+        ])
+        return managers, customers
+
+    def create_items(self, count, categories, managers, rng, batch_size):
+        items = []
+        for start in range(0, count, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, count)):
+                stock = rng.choice([0, 1, 2, 5, 10, 25])
+                batch.append(Item(
+                    category=categories[i % len(categories)],
+                    created_by=managers[i % len(managers)],
+                    name=f'{rng.choice(PRODUCTS)} {rng.randint(100, 9999)} #{i}',
+                    description=f'A {rng.choice(ADJECTIVES)}, {rng.choice(ADJECTIVES)} part.',
+                    price=round(rng.uniform(10, 2000), 2),
+                    stock=stock,
+                    is_sold=stock == 0,
+                ))
+            items.extend(Item.objects.bulk_create(batch))
+            self.stdout.write(f'  {len(items)}/{count} items')
+        return items
+
+    def create_images(self, items, per_item, batch_size):
+        if not per_item:
+            return
+        # A handful of real image files are shared by all the seeded items, so the pages and thumbnails still work
+        files = []
+        for i, colour in enumerate(COLOURS):
+            buffer = BytesIO()
+            Image.new('RGB', (1200, 900), colour).save(buffer, 'JPEG', quality=85)
+            upload = ContentFile(buffer.getvalue(), f'{PREFIX}_{i}.jpg')
+            metadata = image_metadata(upload)
+            name = default_storage.save(f'item_images/{PREFIX}/{upload.name}', upload) # the same blob on every run
+            generate_thumbnails(Images(image=name).image)
+            files.append({
+                'image': name, 'width': metadata['width'], 'height': metadata['height'], 'file_size': metadata['size'],
+                'format': metadata['format'], 'placeholder': metadata['placeholder'],
+            })
+
+        images = [
+            Images(item=item, has_thumbnails=True, **files[(item.pk + n) % len(files)])
+            for item in items for n in range(per_item)
+        ]
+        Images.objects.bulk_create(images, batch_size=batch_size)
+        reconcile_blob_references() # bulk_create skips the signals that count them, see core/blobs.py
+        self.stdout.write(f'Created {len(images)} images')
+
+    def create_carts(self, customers, items, lines_per_cart, rng, batch_size):
+        carts = Cart.objects.bulk_create([Cart(user=customer) for customer in customers])
+        lines = [
+            CartLine(cart=cart, item=item, quantity=rng.randint(1, 3))
+            for cart in carts for item in rng.sample(items, min(lines_per_cart, len(items)))
+        ]
+        CartLine.objects.bulk_create(lines, batch_size=batch_size)
+        self.stdout.write(f'Created {len(carts)} carts with {len(lines)} lines')
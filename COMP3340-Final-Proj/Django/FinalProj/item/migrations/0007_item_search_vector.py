@@ -0,0 +1,59 @@
+# Generated by Django 4.2.3 on 2026-10-18 15:15
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# The search vector is weighted so that matches in the name rank above matches in the description.
+# These only run on PostgreSQL, SQLite uses the FTS5 table from item/search.py instead.
+CREATE_SEARCH_TRIGGER = [
+    """
+    CREATE OR REPLACE FUNCTION item_item_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER item_item_search_vector_trigger
+    BEFORE INSERT OR UPDATE ON item_item
+    FOR EACH ROW EXECUTE FUNCTION item_item_search_vector_update()
+    """,
+    "CREATE INDEX item_item_search_vector_gin ON item_item USING gin (search_vector)",
+    # Touching the rows fires the trigger and fills in the vector for existing items
+    "UPDATE item_item SET name = name",
+]
+
+DROP_SEARCH_TRIGGER = [
+    "DROP INDEX IF EXISTS item_item_search_vector_gin",
+    "DROP TRIGGER IF EXISTS item_item_search_vector_trigger ON item_item",
+    "DROP FUNCTION IF EXISTS item_item_search_vector_update()",
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0006_images_remove_item_image_remove_item_images_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgres(CREATE_SEARCH_TRIGGER), run_on_postgres(DROP_SEARCH_TRIGGER)),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-18 15:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0007_item_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='images',
+            options={'ordering': ('id',)},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.3 on 2026-10-18 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0009_item_ordering_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='images',
+            name='has_thumbnails',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
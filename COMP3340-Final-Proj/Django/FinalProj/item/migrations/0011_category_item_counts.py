@@ -0,0 +1,37 @@
+# Generated by Django 4.2.3 on 2026-10-18 15:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_existing_items(apps, schema_editor):
+    Category = apps.get_model('item', 'Category')
+    Item = apps.get_model('item', 'Item')
+
+    def count_items(condition=Q()):
+        counts = Item.objects.filter(condition, category=OuterRef('pk')).order_by().values('category')
+        return Coalesce(Subquery(counts.annotate(n=Count('id')).values('n')), Value(0))
+
+    Category.objects.update(item_count=count_items(), available_count=count_items(Q(is_sold=False)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0010_images_has_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='available_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.3 on 2026-10-18 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0011_category_item_counts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('is_sold', False)), fields=['created_at', 'id'], name='item_unsold_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('is_sold', False)), fields=['category', 'created_at', 'id'], name='item_unsold_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['created_by', 'created_at', 'id'], name='item_creator_created_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:02
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_from_created_at(apps, schema_editor):
+    Item = apps.get_model('item', 'Item')
+    Item.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0012_item_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(start_from_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.3 on 2026-10-18 15:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0013_item_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('is_sold', False)), fields=['price', 'id'], name='item_unsold_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('is_sold', False)), fields=['category', 'price', 'id'], name='item_unsold_category_price_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.3 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0014_item_price_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='images',
+            name='file_size',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='images',
+            name='format',
+            field=models.CharField(blank=True, editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='images',
+            name='height',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='images',
+            name='placeholder',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='images',
+            name='width',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.3 on 2026-10-19 10:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0015_images_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='images',
+            name='item',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, related_name='images', to='item.item'),
+        ),
+    ]
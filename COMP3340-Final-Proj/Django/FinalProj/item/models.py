@@ -1,9 +1,18 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+
+from core.image_metadata import image_metadata
+from core.jobs import enqueue
+
+from .counters import move_item_counts
+from .thumbnails import THUMBNAIL_SIZES, make_thumbnails, thumbnail_name
 
 # Create your models here.
 class Category(models.Model):
     name = models.CharField(max_length=255)
+    item_count = models.PositiveIntegerField(default=0, editable=False) # all items, see item/counters.py
+    available_count = models.PositiveIntegerField(default=0, editable=False) # items that are not sold
 
     class Meta:
         ordering = ('name',)
@@ -22,20 +31,112 @@ class Item(models.Model):
     stock = models.PositiveIntegerField(default=0)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='items', on_delete=models.CASCADE) # <= if the user is deleted, all the items are deleted as well
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True) # also touched when its images or category change, see item/signals.py
+    search_vector = SearchVectorField(null=True, editable=False) # maintained by a database trigger on PostgreSQL, see item/search.py
+
+    class Meta:
+        ordering = ('-created_at', '-id') # newest first, also the key used by the cursor pagination in item/pagination.py
+        # One index per query shape the views actually run (see the EXPLAIN tests in item/tests.py).
+        # The listings only ever show unsold items, so those indexes are partial and stay small.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='item_created_at_id_idx'), # every item, newest first (CSV export)
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_sold=False), name='item_unsold_created_idx'), # front page, browse
+            models.Index(fields=['category', 'created_at', 'id'], condition=models.Q(is_sold=False), name='item_unsold_category_idx'), # browse by category, related items
+            models.Index(fields=['created_by', 'created_at', 'id'], name='item_creator_created_idx'), # dashboard
+            models.Index(fields=['price', 'id'], condition=models.Q(is_sold=False), name='item_unsold_price_idx'), # browse by price range, ?sort=price_asc/price_desc
+            models.Index(fields=['category', 'price', 'id'], condition=models.Q(is_sold=False), name='item_unsold_category_price_idx'), # same, within categories
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the cached pages of the old category can be purged when the item is moved (item/signals.py)
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
 
     def save(self, *args, **kwargs):
-        # If stock is 0, set is_sold to True
-        if self.stock == 0:
-            self.is_sold = True
+        # If stock is 0, set is_sold to True.
+        # When only some fields are saved (update_fields) is_sold is only touched if the stock is one of them,
+        # so e.g. renaming an item can't write back a stale stock/is_sold over a checkout that just happened.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'stock' in update_fields:
+            self.is_sold = self.stock == 0
+            if update_fields is not None:
+                update_fields = kwargs['update_fields'] = {*update_fields, 'is_sold'}
+        if update_fields:
+            update_fields = kwargs['update_fields'] = {*update_fields, 'updated_at'} # auto_now is only saved when listed
 
-        else:
-            self.is_sold = False
-        super().save(*args, **kwargs)
+        # The category counters are updated in the same transaction as the item
+        with transaction.atomic():
+            old = None
+            if not self._state.adding:
+                old = Item.objects.select_for_update().filter(pk=self.pk).values_list('category_id', 'is_sold').first()
+            super().save(*args, **kwargs)
 
+            new = (self.category_id, self.is_sold)
+            if old is not None and update_fields is not None: # fields that weren't saved keep their database value
+                new = (
+                    self.category_id if {'category', 'category_id'} & set(update_fields) else old[0],
+                    self.is_sold if 'is_sold' in update_fields else old[1],
+                )
+            move_item_counts(old, new)
 
     def __str__(self): 
         return self.name
     
 class Images(models.Model):
     item = models.ForeignKey(Item, related_name='images', on_delete=models.CASCADE, default=None)
-    image = models.ImageField(upload_to='item_images', verbose_name='Image')
\ No newline at end of file
+    image = models.ImageField(upload_to='item_images', verbose_name='Image')
+    has_thumbnails = models.BooleanField(default=False, editable=False) # set once the resized copies exist, see item/thumbnails.py
+    # Read from the upload once, so the pages can size the <img> and show a preview before it loads (core/image_metadata.py)
+    width = models.PositiveIntegerField(null=True, editable=False)
+    height = models.PositiveIntegerField(null=True, editable=False)
+    file_size = models.PositiveBigIntegerField(null=True, editable=False)
+    format = models.CharField(max_length=10, blank=True, editable=False)
+    placeholder = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        # Ordered so that item.images.first is answered from prefetch_related('images') instead of a new query per item
+        ordering = ('id',)
+
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed: # a new upload, still in memory (or a temporary file)
+            self.capture_metadata()
+        super().save(*args, **kwargs)
+        if not self.has_thumbnails and self.image:
+            # Resizing takes a while, a worker does it after the request (until then the pages show the original)
+            enqueue(make_thumbnails, self.pk, dedupe_key=f'thumbnails:{self.pk}')
+
+    def capture_metadata(self):
+        metadata = image_metadata(self.image)
+        if metadata:
+            self.width, self.height, self.file_size = metadata['width'], metadata['height'], metadata['size']
+            self.format, self.placeholder = metadata['format'], metadata['placeholder']
+        return metadata is not None
+
+    def thumbnail_url(self, size):
+        # Falls back to the original upload until the thumbnails have been generated
+        if not self.image:
+            return ''
+        if not self.has_thumbnails:
+            return self.image.url
+        return self.image.storage.url(thumbnail_name(self.image.name, size))
+
+    @property
+    def cart_url(self):
+        return self.thumbnail_url('cart')
+
+    @property
+    def card_url(self):
+        return self.thumbnail_url('card')
+
+    @property
+    def detail_url(self):
+        return self.thumbnail_url('detail')
+
+    @property
+    def srcset(self):
+        # For <img srcset>, lets the browser pick the smallest copy that fits
+        if not self.has_thumbnails:
+            return ''
+        return ', '.join('%s %sw' % (self.thumbnail_url(size), width) for size, width in THUMBNAIL_SIZES.items())
\ No newline at end of file
@@ -0,0 +1,160 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Keyset (cursor) pagination for the catalog listings.
+# Instead of COUNT(*) + OFFSET like django's Paginator, every page is fetched with
+# "WHERE (created_at, id) < (last seen row) ORDER BY ... LIMIT n", so page 1000 costs the same as page 1.
+# The cursor handed to the client is just the ordering values of the first/last row of the page.
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps({'d': direction, 'v': [
+        value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+        for value in values
+    ]})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # Returns (direction, values), or None when the cursor is missing or was tampered with
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        direction, values = payload['d'], payload['v']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+class CursorPage:
+    # Behaves like a Paginator page for the templates (iterable, has_next/has_previous).
+    # The query only runs the first time the page is used.
+
+    def __init__(self, paginator, direction=None, queryset=None):
+        self.paginator = paginator
+        self.direction = direction
+        self.queryset = queryset
+        self._object_list = None
+
+    @property
+    def object_list(self):
+        self._fetch()
+        return self._object_list
+
+    def _fetch(self):
+        if self._object_list is not None:
+            return
+        paginator = self.paginator
+        per_page = paginator.per_page
+        if self.direction is None:
+            rows = list(paginator.object_list.order_by(*paginator.ordering)[:per_page + 1])
+            self._has_next, self._has_previous = len(rows) > per_page, False
+            rows = rows[:per_page]
+        elif self.direction == 'next':
+            rows = list(self.queryset[:per_page + 1])
+            self._has_next, self._has_previous = len(rows) > per_page, True
+            rows = rows[:per_page]
+        else:
+            # Walk backwards from the cursor, then flip the rows back into display order
+            rows = list(self.queryset[:per_page + 1])
+            self._has_next, self._has_previous = True, len(rows) > per_page
+            rows = rows[:per_page][::-1]
+        self._object_list = rows
+
+    def has_next(self):
+        self._fetch()
+        return self._has_next
+
+    def has_previous(self):
+        self._fetch()
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return encode_cursor('next', self.paginator.key(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        return encode_cursor('prev', self.paginator.key(self.object_list[0]))
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class CursorPaginator:
+    def __init__(self, object_list, per_page, ordering=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        ordering = list(ordering or object_list.query.order_by or object_list.model._meta.ordering)
+        # The last ordering field has to be unique, otherwise rows sharing a value could be skipped
+        if not ordering or ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('-id' if ordering and ordering[-1].startswith('-') else 'id')
+        self.ordering = ordering
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def key(self, obj):
+        # obj is a model instance, or a dict when paginating .values() (the JSON API)
+        if isinstance(obj, dict):
+            return [obj[field] for field, descending in self.fields]
+        return [getattr(obj, field) for field, descending in self.fields]
+
+    def seek(self, values, forward=True):
+        # Rows strictly after (forward) or before the given ordering values:
+        # (a > x) OR (a = x AND b > y) OR ...
+        condition = Q()
+        for i, (field, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{'%s__%s' % (field, lookup): values[i]})
+            for j in range(i):
+                term &= Q(**{self.fields[j][0]: values[j]})
+            condition |= term
+        # Redundant bound on the leading column so the database can range-scan the index
+        first_field, descending = self.fields[0]
+        condition &= Q(**{'%s__%s' % (first_field, 'lte' if descending == forward else 'gte'): values[0]})
+
+        if forward:
+            ordering = self.ordering
+        else:
+            ordering = [name[1:] if name.startswith('-') else '-' + name for name in self.ordering]
+        return self.object_list.filter(condition).order_by(*ordering)
+
+    def get_page(self, cursor=None):
+        # Like Paginator.get_page(): a missing or invalid cursor just gives the first page
+        decoded = decode_cursor(cursor)
+        if decoded is None or len(decoded[1]) != len(self.fields):
+            return CursorPage(self)
+        direction, values = decoded
+        try:
+            queryset = self.seek(values, forward=direction == 'next')
+        except (TypeError, ValueError, ValidationError):
+            # The cursor values don't fit this listing (e.g. a cursor copied from another page)
+            return CursorPage(self)
+        return CursorPage(self, direction, queryset)
+
+
+def page_query(request):
+    # The current query string without the cursor, so the page links keep the selected search/filters
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return params.urlencode()
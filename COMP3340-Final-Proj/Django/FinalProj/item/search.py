@@ -0,0 +1,133 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+from django.db.models.expressions import RawSQL
+
+# Full-text search for the catalog.
+# On PostgreSQL the `search_vector` column on item_item is kept up to date by a trigger (see migration 0007)
+# and searched through a GIN index. On SQLite (dev/tests) we use an FTS5 table that mirrors item_item through triggers.
+
+FTS_TABLE = 'item_item_fts'
+
+SQLITE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, content='item_item', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON item_item BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON item_item BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON item_item BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+]
+
+
+def install_sqlite_fts(connection):
+    # SQLite drops triggers whenever a migration has to rebuild item_item, so this runs after every migrate.
+    # If any trigger was missing the index may be stale, so it gets rebuilt from the item table.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [FTS_TABLE + '_%']
+        )
+        triggers_present = cursor.fetchone()[0]
+        for statement in SQLITE_FTS_SQL:
+            cursor.execute(statement)
+        if triggers_present < 3:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def fts5_match_expression(query):
+    # Quote every word so user input can't inject FTS5 syntax, and allow prefix matches ("ryz" -> "ryzen")
+    words = re.findall(r'\w+', query)
+    return ' '.join('"%s"*' % word for word in words)
+
+
+def search_items(items, query):
+    # Filters the given Item queryset down to the items matching `query` and orders them by relevance.
+    # Any other filters (category, is_sold...) already applied to `items` are kept.
+    vendor = connections[items.db].vendor
+
+    if vendor == 'postgresql':
+        search_query = SearchQuery(query, config='english', search_type='websearch')
+        # ts_rank() returns a float4, cast it so the value round-trips exactly through pagination cursors
+        return items.filter(search_vector=search_query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+        ).order_by('-rank', '-id')
+
+    if vendor == 'sqlite':
+        match = fts5_match_expression(query)
+        if not match:
+            return items.none()
+        # bm25() is lower for better matches, and name hits weigh 10x more than description hits
+        return items.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+        ).annotate(
+            rank=RawSQL(
+                f"SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = item_item.id",
+                (match,),
+            )
+        ).order_by('-rank', '-id')
+
+    # Any other database just gets the old substring search
+    return items.filter(Q(name__icontains=query) | Q(description__icontains=query))
+
+
+# ?sort= values for the listings, None keeps the default order (newest first, or best match when searching)
+SORTS = {
+    'newest': None,
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+}
+
+
+def sort_ordering(params):
+    return SORTS.get(params.get('sort'))
+
+
+def _number(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def price_range(params):
+    # (min_price, max_price) from the query string, either can be None
+    return _number(params.get('min_price')), _number(params.get('max_price'))
+
+
+def price_filter(price):
+    low, high = price
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lte=high)
+    return condition
+
+
+def filter_params(params):
+    # The filters of the browse page in a query string: (query, selected categories, price range)
+    return params.get('query', ''), params.getlist('category'), price_range(params)
+
+
+# The search/category/price filters of the browse page, also used by the CSV export, the API and the validators
+def filter_items(items, query, selected_categories, price=(None, None)):
+    if selected_categories:
+        items = items.filter(category__in=selected_categories)
+
+    if price != (None, None):
+        items = items.filter(price_filter(price))
+
+    if query:
+        items = search_items(items, query) # full-text search, best matches first
+
+    return items
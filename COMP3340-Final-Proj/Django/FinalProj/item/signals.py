@@ -0,0 +1,82 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.page_cache import purge
+
+from . import suggest
+from .cache import bump_catalog_version, purge_item_pages
+from .counters import move_item_counts
+from .models import Category, Item, Images
+
+
+@receiver(post_delete, sender=Item)
+def item_deleted(sender, instance, **kwargs):
+    # A signal rather than Item.delete() so items removed by a cascade (user or category deleted) count too
+    move_item_counts((instance.category_id, instance.is_sold), None)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=Images)
+@receiver(post_delete, sender=Images)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    # Invalidates every cached catalog fragment, see item/cache.py
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def item_pages_changed(sender, instance, **kwargs):
+    # Both the category it is in and the one it was loaded with, in case it was moved
+    purge_item_pages([instance.pk], {instance.category_id, getattr(instance, '_loaded_category_id', None)})
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_save, sender=Images)
+@receiver(post_delete, sender=Images)
+def image_pages_changed(sender, instance, origin=None, **kwargs):
+    if origin is not None and getattr(origin, 'model', type(origin)) is not Images:
+        return # deleted together with its item, whose own signal purges the pages
+    if Images.item.is_cached(instance):
+        category_id = instance.item.category_id
+    else:
+        category_id = Item.objects.filter(pk=instance.item_id).values_list('category_id', flat=True).first()
+    purge_item_pages([instance.item_id], [category_id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_pages_changed(sender, instance, **kwargs):
+    purge('items', 'categories', f'category:{instance.pk}')
+
+
+# Item.updated_at covers what the item's pages show, so it moves when its images or its category change too
+@receiver(post_save, sender=Images)
+@receiver(post_delete, sender=Images)
+def touch_item_of_image(sender, instance, origin=None, **kwargs):
+    if origin is not None and getattr(origin, 'model', type(origin)) is not Images:
+        return # deleted together with its item
+    Item.objects.filter(pk=instance.item_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Category)
+def touch_items_of_category(sender, instance, created, **kwargs):
+    if not created:
+        Item.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+# The in-process index behind /items/suggest/, see item/suggest.py
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def item_suggestions_changed(sender, instance, signal, **kwargs):
+    name = instance.name if signal is post_save and not instance.is_sold else None
+    suggest.index.update('item', instance.pk, name)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_suggestions_changed(sender, instance, signal, **kwargs):
+    suggest.index.update('category', instance.pk, instance.name if signal is post_save else None)
@@ -0,0 +1,125 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Category, Item
+
+# Search-as-you-type suggestions for the browse search box (/items/suggest/?q=ryz).
+# Every process keeps a sorted list of the lowercased item and category names, plus every word in them,
+# so "5600" finds "Ryzen 5 5600X". A prefix is found with a binary search and keystrokes never reach the
+# database. The index is built on the first request and then kept up to date by the Item/Category signals
+# (item/signals.py). Other processes only see a change after SUGGEST_INDEX_MAX_AGE, when they rebuild it.
+# Only unsold items are suggested, newest first when the index is full.
+
+MAX_WORDS = 5 # per name, how many of its words can be searched from
+
+
+def max_entries():
+    return getattr(settings, 'SUGGEST_MAX_ENTRIES', 50000)
+
+
+def max_age():
+    return getattr(settings, 'SUGGEST_INDEX_MAX_AGE', 300)
+
+
+def name_keys(name):
+    # The whole name, then the name from each of its next words on
+    words = name.lower().split()[:MAX_WORDS]
+    return list(dict.fromkeys(' '.join(words[i:]) for i in range(len(words))))
+
+
+class PrefixIndex:
+    KINDS = ('item', 'category')
+
+    def __init__(self):
+        self.entries = {kind: [] for kind in self.KINDS} # sorted (key, id) per kind
+        self.names = {} # (kind, id) -> name
+        self.size = 0
+        self.limit = 0
+        self.lock = threading.Lock()
+        self.built_at = None
+
+    def build(self):
+        categories = Category.objects.values_list('id', 'name')
+        items = Item.objects.filter(is_sold=False).order_by('-created_at', '-id').values_list('id', 'name')
+        with self.lock:
+            self.entries, self.names, self.size = {kind: [] for kind in self.KINDS}, {}, 0
+            self.limit = max_entries()
+            for pk, name in categories:
+                self._add('category', pk, name)
+            for pk, name in items.iterator():
+                if not self._add('item', pk, name):
+                    break
+            for entries in self.entries.values():
+                entries.sort()
+            self.built_at = time.monotonic()
+
+    def invalidate(self):
+        # After changes that didn't send signals (bulk imports), rebuilt on the next request
+        with self.lock:
+            self.built_at = None
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > max_age()
+
+    def _add(self, kind, pk, name, keep_sorted=False):
+        keys = name_keys(name)
+        if self.size + len(keys) > self.limit:
+            return False # full, the next rebuild picks the newest items again
+        self.names[kind, pk] = name
+        self.size += len(keys)
+        for key in keys:
+            if keep_sorted:
+                bisect.insort(self.entries[kind], (key, pk))
+            else:
+                self.entries[kind].append((key, pk))
+        return True
+
+    def _remove(self, kind, pk):
+        name = self.names.pop((kind, pk), None)
+        if name is None:
+            return
+        entries = self.entries[kind]
+        for key in name_keys(name):
+            i = bisect.bisect_left(entries, (key, pk))
+            if i < len(entries) and entries[i] == (key, pk):
+                del entries[i]
+                self.size -= 1
+
+    def update(self, kind, pk, name=None):
+        # name=None removes it (deleted, or an item that was sold)
+        if self.built_at is None:
+            return # not built in this process yet
+        with self.lock:
+            self._remove(kind, pk)
+            if name is not None:
+                self._add(kind, pk, name, keep_sorted=True)
+
+    def search(self, prefix, limit):
+        # {kind: [(id, name)]}, up to `limit` of each whose name (or one of its words) starts with prefix
+        prefix = ' '.join(prefix.lower().split())
+        found = {kind: [] for kind in self.KINDS}
+        if not prefix:
+            return found
+        with self.lock:
+            for kind, entries in self.entries.items():
+                seen = set()
+                for i in range(bisect.bisect_left(entries, (prefix,)), len(entries)):
+                    key, pk = entries[i]
+                    if len(seen) >= limit or not key.startswith(prefix):
+                        break
+                    if pk not in seen:
+                        seen.add(pk)
+                        found[kind].append((pk, self.names[kind, pk]))
+        return found
+
+
+index = PrefixIndex()
+
+
+def suggestions(prefix, limit):
+    if index.is_stale():
+        index.build()
+    return index.search(prefix, limit)
@@ -1,3 +1,688 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .apps import setup_search_index
+from .cache import catalog_version
+from .conditional import detail_items
+from .export import EXPORT_COLUMNS, ROWS_PER_CHUNK
+from .facets import browse_facets
+from .imports import import_items
+from .models import Category, Images, Item
+from .pagination import CursorPaginator, encode_cursor
+from .search import FTS_TABLE, SORTS, filter_items, search_items
+from .suggest import index as suggest_index
+from .thumbnails import THUMBNAIL_SIZES, thumbnail_name
+
+
+class ListingQueryPlanTests(TestCase):
+    # Runs the querysets of the listing views through EXPLAIN against a seeded catalog and fails if one of them
+    # goes back to scanning the whole item table, or to sorting it instead of reading an index in order.
+    # Keep these in sync with the indexes in Item.Meta.
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = User.objects.bulk_create([User(username=f'manager{i}', is_inventoryManager=True) for i in range(5)])
+        cls.categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(20)])
+        Item.objects.bulk_create([
+            Item(
+                category=cls.categories[i % 20], created_by=cls.users[i % 5],
+                name=f'Item {i}', price=i, stock=i % 7, is_sold=i % 7 == 0,
+            )
+            for i in range(3000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # On a test-sized table the planner may still prefer a seq scan, this makes it use any index that fits
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def assertUsesIndex(self, queryset, ordered_by_index=True):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan on item_item', plan)
+            if ordered_by_index:
+                self.assertNotRegex(plan, r'\bSort\b')
+        elif connection.vendor == 'sqlite':
+            scans = [line for line in plan.splitlines() if 'SCAN item_item' in line and 'USING' not in line]
+            self.assertEqual(scans, [], plan)
+            if ordered_by_index:
+                self.assertNotIn('TEMP B-TREE', plan)
+        return plan
+
+    def test_front_page_and_browse(self):
+        self.assertUsesIndex(Item.objects.filter(is_sold=False)[:9])
+
+    def test_browse_next_page(self):
+        paginator = CursorPaginator(Item.objects.filter(is_sold=False), 9)
+        second_page = paginator.get_page(paginator.get_page(None).next_cursor)
+        self.assertUsesIndex(second_page.queryset[:10])
+
+    def test_browse_by_category(self):
+        self.assertUsesIndex(Item.objects.filter(is_sold=False, category__in=[self.categories[1].id])[:9])
+        # Several categories are several index ranges, merging them needs a sort but still no table scan
+        categories = [self.categories[1].id, self.categories[2].id]
+        self.assertUsesIndex(Item.objects.filter(is_sold=False, category__in=categories)[:9], ordered_by_index=False)
+
+    def test_browse_by_price(self):
+        by_price = CursorPaginator(Item.objects.filter(is_sold=False), 9, ordering=SORTS['price_asc'])
+        self.assertUsesIndex(by_price.object_list.order_by(*by_price.ordering)[:10])
+        self.assertUsesIndex(by_price.get_page(by_price.get_page(None).next_cursor).queryset[:10])
+        in_range = filter_items(Item.objects.filter(is_sold=False), '', [], (100, 250)).order_by(*SORTS['price_desc'])
+        self.assertUsesIndex(in_range[:9])
+        in_category = filter_items(Item.objects.filter(is_sold=False), '', [self.categories[1].id], (100, 250))
+        self.assertUsesIndex(in_category.order_by(*SORTS['price_asc'])[:9])
+
+    def test_related_items(self):
+        item = Item.objects.filter(category=self.categories[3]).first()
+        self.assertUsesIndex(Item.objects.filter(category_id=item.category_id, is_sold=False).exclude(pk=item.pk)[:3])
+
+    def test_detail_validators(self):
+        item = Item.objects.filter(category=self.categories[3]).first()
+        plan = self.assertUsesIndex(detail_items(item.pk).order_by(), ordered_by_index=False)
+        self.assertNotIn('item_category', plan) # no join back through the category
+
+    def test_dashboard(self):
+        self.assertUsesIndex(Item.objects.filter(created_by=self.users[1])[:6])
+
+
+class SearchTests(TestCase):
+    # Full-text search (item/search.py): FTS5 on SQLite, the trigger-maintained search_vector on PostgreSQL
+
+    def setUp(self):
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        category = Category.objects.create(name='CPU')
+        def item(name, description=''):
+            return Item.objects.create(category=category, created_by=manager, name=name, description=description, price=1, stock=1)
+        self.in_description = item('Cooler', 'Quiet enough for any Ryzen build')
+        self.in_name = item('Ryzen 5 5600X')
+        self.in_name_too = item('Ryzen 7 5800X')
+        self.unrelated = item('Radeon RX 7600')
+
+    def search(self, query):
+        return list(search_items(Item.objects.all(), query))
+
+    def test_name_matches_rank_above_description_matches(self):
+        # The two name matches tie on rank and come newest first (-id)
+        self.assertEqual(self.search('ryzen'), [self.in_name_too, self.in_name, self.in_description])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.in_name.name = 'Athlon 3000G'
+        self.in_name.save()
+        self.in_name_too.delete()
+        self.assertEqual(self.search('ryzen'), [self.in_description])
+        self.assertEqual(self.search('athlon'), [self.in_name])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 is the SQLite backend')
+    def test_sqlite_prefixes_and_quoting(self):
+        self.assertEqual(self.search('ryz'), [self.in_name_too, self.in_name, self.in_description])
+        self.assertEqual(self.search('ryzen OR radeon'), []) # the words are quoted, "or" isn't FTS5 syntax
+        self.assertEqual(self.search('!!'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 is the SQLite backend')
+    def test_sqlite_triggers_are_reinstalled_after_migrate(self):
+        # A migration that rebuilds item_item drops its triggers, post_migrate puts them back and reindexes
+        with connection.cursor() as cursor:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER {FTS_TABLE}_{suffix}')
+        Item.objects.filter(pk=self.unrelated.pk).update(name='Ryzen 9 7950X') # not indexed without the trigger
+        self.assertNotIn(self.unrelated, self.search('ryzen'))
+
+        setup_search_index(sender=None, using=connection.alias)
+        self.assertIn(self.unrelated, self.search('ryzen'))
+        self.unrelated.name = 'Radeon RX 7600'
+        self.unrelated.save()
+        self.assertNotIn(self.unrelated, self.search('ryzen'))
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.category = Category.objects.create(name='CPU')
+        self.item = Item.objects.create(category=self.category, created_by=manager, name='Ryzen', price=1, stock=1)
+        self.client.force_login(manager) # logged in, so the full-page cache stays out of the way
+
+    def browse(self):
+        return self.client.get(reverse('item:browse')).content.decode()
+
+    def test_item_list_follows_item_changes(self):
+        self.assertIn('Ryzen', self.browse())
+        Item.objects.filter(pk=self.item.pk).update(name='Athlon') # no signal, so the cached grid is served
+        self.assertNotIn('Athlon', self.browse())
+
+        self.item.name = 'Threadripper'
+        self.item.save() # bumps the catalog version
+        self.assertIn('Threadripper', self.browse())
+
+    def test_category_lists_follow_category_changes(self):
+        self.assertIn('CPU', self.client.get(reverse('core:index')).content.decode())
+        self.assertIn('CPU', self.browse())
+        Category.objects.filter(pk=self.category.pk).update(name='Processors')
+        self.assertNotIn('Processors', self.browse())
+
+        self.category.name = 'Chips'
+        self.category.save()
+        self.assertIn('Chips', self.browse())
+        self.assertIn('Chips', self.client.get(reverse('core:index')).content.decode())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear() # so the responses come from the views and not the page cache
+        self.manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.category = Category.objects.create(name='CPU')
+        self.item = Item.objects.create(category=self.category, created_by=self.manager, name='Ryzen', price=1, stock=2)
+        self.client.force_login(self.manager) # logged in, so the page cache stays out of the way
+
+    def assertRevalidates(self, url, change, **headers):
+        etag = self.client.get(url, **headers)['ETag']
+        with self.assertNumQueries(3): # session, user, the aggregate for the validators
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_changes_with_the_item(self):
+        def change():
+            self.item.stock = 1
+            self.item.save(update_fields=['stock'])
+        self.assertRevalidates(reverse('item:detail', args=[self.item.pk]), change)
+
+    def test_detail_changes_with_its_images(self):
+        def change():
+            Images.objects.create(item=self.item, image='item_images/ryzen.jpg', has_thumbnails=True)
+        self.assertRevalidates(reverse('item:detail', args=[self.item.pk]), change)
+
+    def test_detail_changes_with_its_related_items(self):
+        def change():
+            Item.objects.create(category=self.category, created_by=self.manager, name='Ryzen 2', price=1, stock=2)
+        self.assertRevalidates(reverse('item:detail', args=[self.item.pk]), change)
+
+    def test_browse_ajax_changes_with_the_matching_items(self):
+        def change():
+            self.item.delete()
+            Item.objects.create(category=self.category, created_by=self.manager, name='Ryzen 2', price=1, stock=2)
+        url = reverse('item:browse') + f'?category={self.category.pk}'
+        self.assertRevalidates(url, change, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_browse_ajax_changes_with_the_facets(self):
+        # An item outside the price filter doesn't change the matching items, but it does change the price facet
+        def change():
+            Item.objects.create(category=self.category, created_by=self.manager, name='Ryzen 9', price=300, stock=2)
+        url = reverse('item:browse') + f'?category={self.category.pk}&max_price=50'
+        self.assertRevalidates(url, change, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_browse_ignores_invalid_categories(self):
+        url = reverse('item:browse') + '?category=abc'
+        self.assertContains(self.client.get(url), 'Ryzen')
+        self.assertEqual(self.client.get(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest').status_code, 200)
+
+    def test_category_rename_touches_its_items(self):
+        before = Item.objects.get().updated_at
+        self.category.name = 'Processors'
+        self.category.save()
+        self.assertGreater(Item.objects.get().updated_at, before)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        category = Category.objects.create(name='CPU')
+        Item.objects.bulk_create([
+            Item(category=category, created_by=manager, name=f'Ryzen {i}', price=1, stock=1) for i in range(8)
+        ])
+        # Three items per timestamp, so most pages start or end in the middle of a tie
+        start = timezone.now()
+        for i, pk in enumerate(Item.objects.order_by('id').values_list('id', flat=True)):
+            Item.objects.filter(pk=pk).update(created_at=start - timedelta(minutes=i // 3))
+        self.expected = list(Item.objects.order_by('-created_at', '-id'))
+        self.paginator = CursorPaginator(Item.objects.all(), 3)
+
+    def test_walks_forward_and_back_across_ties(self):
+        pages = [self.paginator.get_page(None)]
+        while pages[-1].has_next():
+            pages.append(self.paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([item for page in pages for item in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+        self.assertFalse(pages[0].has_previous())
+        self.assertIsNone(pages[-1].next_cursor)
+
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(self.paginator.get_page(back[-1].previous_cursor))
+        self.assertEqual([list(page) for page in back[1:]], [list(page) for page in pages[-2::-1]])
+        self.assertTrue(back[-1].has_next())
+
+    def test_bad_cursors_give_the_first_page(self):
+        first = list(self.paginator.get_page(None))
+        wrong_length = encode_cursor('next', [1])
+        wrong_type = encode_cursor('next', ['not a date', 'not an id'])
+        wrong_direction = encode_cursor('sideways', [timezone.now(), 1])
+        for cursor in ['garbage!', 'e30', wrong_length, wrong_type, wrong_direction]:
+            self.assertEqual(list(self.paginator.get_page(cursor)), first, cursor)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.cpu = Category.objects.create(name='CPU')
+        self.gpu = Category.objects.create(name='GPU')
+        for i in range(5):
+            Item.objects.create(category=self.cpu, created_by=manager, name=f'Ryzen {i}', price=100 + i, stock=1)
+        Item.objects.create(category=self.gpu, created_by=manager, name='Radeon', price=300, stock=1)
+        Item.objects.create(category=self.gpu, created_by=manager, name='Sold out', price=300, stock=0)
+
+    def get(self, **params):
+        response = self.client.get(reverse('item:api_items'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_walks_every_unsold_item_with_the_cursor(self):
+        names, cursor = [], None
+        while True:
+            data = self.get(limit=2, **({'cursor': cursor} if cursor else {}))
+            names += [row['name'] for row in data['results']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(names, ['Radeon'] + [f'Ryzen {i}' for i in reversed(range(5))])
+
+    def test_only_the_requested_fields_are_returned(self):
+        data = self.get(fields='id,name,category_name', category=self.gpu.pk)
+        self.assertEqual(data['results'], [{'id': Item.objects.get(name='Radeon').pk, 'name': 'Radeon', 'category_name': 'GPU'}])
+
+    def test_facets_count_matches_in_every_category(self):
+        data = self.get(category=self.gpu.pk)
+        self.assertEqual(data['facets']['categories'], [
+            {'id': self.cpu.pk, 'name': 'CPU', 'count': 5},
+            {'id': self.gpu.pk, 'name': 'GPU', 'count': 1},
+        ])
+
+    def test_sorts_by_price_within_the_price_range(self):
+        names, cursor = [], None
+        while True:
+            data = self.get(limit=2, sort='price_desc', min_price=101, max_price=300, **({'cursor': cursor} if cursor else {}))
+            names += [row['name'] for row in data['results']]
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(names, ['Radeon', 'Ryzen 4', 'Ryzen 3', 'Ryzen 2', 'Ryzen 1'])
+
+    def test_price_and_stock_facets_follow_the_selected_categories(self):
+        facets = self.get(category=self.gpu.pk)['facets']
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [0, 0, 0, 1, 0, 0, 0])
+        self.assertEqual((facets['in_stock'], facets['out_of_stock']), (1, 1))
+        facets = self.get()['facets']
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [0, 0, 5, 1, 0, 0, 0])
+
+    def test_facets_are_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            browse_facets('ryzen', [], (None, None))
+        with self.assertNumQueries(0):
+            browse_facets('ryzen', [str(self.cpu.pk)], (None, None))
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('item:api_items'), {'fields': 'id,password'}).status_code, 400)
+
+    def test_invalid_categories_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('item:api_items'), {'category': 'abc'}).status_code, 400)
+
+
+class SuggestTests(TestCase):
+    def setUp(self):
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.cpu = Category.objects.create(name='CPU')
+        self.ryzen = Item.objects.create(category=self.cpu, created_by=manager, name='AMD Ryzen 5 5600X', price=200, stock=1)
+        Item.objects.create(category=self.cpu, created_by=manager, name='Intel Core i5', price=180, stock=1)
+        suggest_index.build()
+
+    def suggest(self, prefix):
+        response = self.client.get(reverse('item:suggest'), {'q': prefix})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        return [row['name'] for row in data['categories'] + data['items']]
+
+    def test_matches_the_start_of_any_word(self):
+        self.assertEqual(self.suggest('ryz'), ['AMD Ryzen 5 5600X'])
+        self.assertEqual(self.suggest('5600'), ['AMD Ryzen 5 5600X'])
+        self.assertEqual(self.suggest('c'), ['CPU', 'Intel Core i5'])
+        self.assertEqual(self.suggest('zen'), [])
+
+    def test_keystrokes_never_query_the_database(self):
+        with self.assertNumQueries(0):
+            self.suggest('am')
+
+    def test_follows_item_and_category_changes(self):
+        self.ryzen.name = 'AMD Ryzen 7 5800X'
+        self.ryzen.save()
+        self.assertEqual(self.suggest('5600'), [])
+        self.assertEqual(self.suggest('5800'), ['AMD Ryzen 7 5800X'])
+        self.ryzen.stock = 0
+        self.ryzen.save() # sold out
+        self.assertEqual(self.suggest('amd'), [])
+        self.cpu.name = 'Processors'
+        self.cpu.save()
+        self.assertEqual(self.suggest('p'), ['Processors'])
+
+    def test_index_size_is_bounded(self):
+        with self.settings(SUGGEST_MAX_ENTRIES=6): # room for the category and the newest item, not the other one
+            suggest_index.build()
+        self.assertEqual(self.suggest('i'), ['Intel Core i5'])
+        self.assertEqual(self.suggest('amd'), [])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        cpu = Category.objects.create(name='CPU')
+        gpu = Category.objects.create(name='GPU')
+        # More rows than ROWS_PER_CHUNK, so the export is sent in several chunks
+        Item.objects.bulk_create(
+            [Item(category=cpu, created_by=self.manager, name=f'Ryzen {i}', price=100 + i, stock=1) for i in range(ROWS_PER_CHUNK + 10)]
+            + [Item(category=gpu, created_by=self.manager, name='Radeon', price=300, stock=0, is_sold=True)]
+        )
+        self.client.force_login(self.manager)
+
+    def export(self, **params):
+        response = self.client.get(reverse('item:export_items_to_csv'), params)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        chunks = list(response.streaming_content)
+        return response, chunks
+
+    def rows(self, content):
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_streams_every_matching_row(self):
+        response, chunks = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertGreater(len(chunks), 1)
+        header, *rows = self.rows(b''.join(chunks).decode())
+        self.assertEqual(header, [column for column, field in EXPORT_COLUMNS])
+        self.assertEqual(len(rows), ROWS_PER_CHUNK + 11)
+
+        radeon = Item.objects.get(name='Radeon')
+        row = dict(zip(header, next(row for row in rows if row[0] == str(radeon.pk))))
+        self.assertEqual(
+            (row['Category'], row['Name'], row['Price'], row['Is Sold'], row['Stock'], row['Created By']),
+            ('GPU', 'Radeon', '300.0', 'True', '0', 'manager'),
+        )
+
+    def test_filters_like_browse(self):
+        gpu = Category.objects.get(name='GPU')
+        response, chunks = self.export(category=gpu.pk)
+        self.assertEqual([row[2] for row in self.rows(b''.join(chunks).decode())[1:]], ['Radeon'])
+
+        response, chunks = self.export(max_price=105)
+        self.assertEqual(len(self.rows(b''.join(chunks).decode())), 1 + 6) # header and Ryzen 0-5
+
+    def test_gzip_is_the_same_csv(self):
+        plain = b''.join(self.export()[1])
+        response, chunks = self.export(gzip=1)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('items_export.csv.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(b''.join(chunks)), plain)
+
+
+class CategoryCounterTests(TestCase):
+    # Category.item_count/available_count, see item/counters.py
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.cpu = Category.objects.create(name='CPU')
+        self.gpu = Category.objects.create(name='GPU')
+
+    def assertCounts(self, category, total, available):
+        category.refresh_from_db()
+        self.assertEqual((category.item_count, category.available_count), (total, available))
+
+    def create_item(self, category=None, stock=1):
+        return Item.objects.create(category=category or self.cpu, created_by=self.manager, name='Ryzen', price=200, stock=stock)
+
+    def test_create_and_delete(self):
+        item = self.create_item()
+        self.create_item(stock=0)
+        self.assertCounts(self.cpu, 2, 1)
+        item.delete()
+        self.assertCounts(self.cpu, 1, 0)
+
+    def test_stock_change_that_flips_is_sold(self):
+        item = self.create_item(stock=2)
+        item.stock = 0
+        item.save(update_fields=['stock'])
+        self.assertCounts(self.cpu, 1, 0)
+        item.stock = 5
+        item.save()
+        self.assertCounts(self.cpu, 1, 1)
+        item.stock = 4 # still available
+        item.save()
+        self.assertCounts(self.cpu, 1, 1)
+
+    def test_moving_between_categories(self):
+        item = self.create_item()
+        item.category = self.gpu
+        item.save()
+        self.assertCounts(self.cpu, 0, 0)
+        self.assertCounts(self.gpu, 1, 1)
+
+        # A save of other fields from a stale copy doesn't move it back
+        stale = Item.objects.get(pk=item.pk)
+        stale.category = self.cpu
+        stale.save(update_fields=['name'])
+        self.assertCounts(self.cpu, 0, 0)
+        self.assertCounts(self.gpu, 1, 1)
+
+    def test_counts_never_go_below_zero(self):
+        item = self.create_item()
+        Category.objects.filter(pk=self.cpu.pk).update(item_count=0, available_count=0) # drifted
+        item.delete()
+        self.assertCounts(self.cpu, 0, 0)
+
+    def test_reconcile_command_repairs_drift(self):
+        self.create_item()
+        self.create_item(category=self.gpu, stock=0)
+        Item.objects.filter(category=self.cpu).update(is_sold=True) # update() skips the counters
+        Category.objects.filter(pk=self.gpu.pk).update(item_count=7)
+
+        out = io.StringIO()
+        call_command('reconcile_category_counts', stdout=out)
+        self.assertCounts(self.cpu, 1, 0)
+        self.assertCounts(self.gpu, 1, 0)
+        self.assertIn(f'Category {self.cpu.pk}: 1/1 -> 1/0', out.getvalue())
+        self.assertIn(f'Category {self.gpu.pk}: 7/0 -> 1/0', out.getvalue())
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.cpu = Category.objects.create(name='CPU')
+        self.item = Item.objects.create(category=self.cpu, created_by=self.manager, name='Ryzen', price=200, stock=3)
+
+    def test_export_can_be_imported_back(self):
+        self.client.force_login(self.manager)
+        exported = b''.join(self.client.get(reverse('item:export_items_to_csv')).streaming_content).decode()
+        exported = exported.replace('Ryzen', 'Ryzen 5').replace(',3,', ',0,') # renamed and sold out
+        exported += ',CPU,Core i5,,180,False,4,,\r\n' # a new item
+        result = import_items(io.StringIO(exported), 'csv', self.manager)
+        self.assertEqual((result.created, result.updated, result.errors), (1, 1, []))
+
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.name, self.item.stock, self.item.is_sold), ('Ryzen 5', 0, True))
+        self.cpu.refresh_from_db()
+        self.assertEqual((self.cpu.item_count, self.cpu.available_count), (2, 1))
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        rows = [
+            {'Category': 'CPU', 'Name': 'Core i7', 'Price': '300', 'Stock': '2'},
+            {'Category': 'GPU', 'Name': 'Radeon', 'Price': '300', 'Stock': '2'},
+            {'Category': 'CPU', 'Name': '', 'Price': 'cheap', 'Stock': '-1'},
+            {'ID': '999', 'Category': 'CPU', 'Name': 'Gone', 'Price': '1', 'Stock': '1'},
+        ]
+        data = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+        result = import_items(io.StringIO(data), 'jsonl', self.manager, batch_size=2)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, message in result.errors], [2, 3, 4, 5])
+        self.assertIn('no category named "GPU"', result.errors[0][1])
+        self.assertIn('name:', result.errors[1][1])
+        self.assertIn('price:', result.errors[1][1])
+        self.assertIn('stock:', result.errors[1][1])
+
+        result = import_items(io.StringIO(json.dumps(rows[1])), 'jsonl', self.manager, create_categories=True)
+        self.assertEqual((result.created, result.errors), (1, []))
+        self.assertEqual(Category.objects.get(name='GPU').item_count, 1)
+
+    def test_dry_run_writes_nothing(self):
+        data = json.dumps({'Category': 'GPU', 'Name': 'Radeon', 'Price': '300', 'Stock': '2'})
+        result = import_items(io.StringIO(data), 'jsonl', self.manager, create_categories=True, dry_run=True)
+        self.assertEqual((result.created, result.errors), (1, []))
+        self.assertFalse(Category.objects.filter(name='GPU').exists())
+        self.assertEqual(Item.objects.count(), 1)
+
+    def test_view_is_for_inventory_managers(self):
+        upload = io.BytesIO(b'Category,Name,Price,Stock\r\nCPU,Core i3,90,1\r\n')
+        upload.name = 'items.csv'
+        customer = get_user_model().objects.create_user(username='customer', is_customer=True)
+        self.client.force_login(customer)
+        self.assertEqual(self.client.post(reverse('item:import_items'), {'file': upload}).status_code, 302)
+
+        upload.seek(0)
+        self.client.force_login(self.manager)
+        response = self.client.post(reverse('item:import_items'), {'file': upload})
+        self.assertContains(response, 'Imported 1 new and 0 updated items')
+        self.assertTrue(Item.objects.filter(name='Core i3', created_by=self.manager).exists())
+
+    def test_a_file_that_is_not_utf8_is_reported(self):
+        upload = io.BytesIO(b'Category,Name,Price,Stock\r\nCPU,Core i3,90,1\r\nCPU,Caf\xe9,90,1\r\n') # Latin-1
+        upload.name = 'items.csv'
+        self.client.force_login(self.manager)
+        response = self.client.post(reverse('item:import_items'), {'file': upload})
+        self.assertContains(response, 'the file is not UTF-8 text')
+        self.assertEqual(Item.objects.count(), 1)
+
+    def test_counters_and_caches_are_updated_when_an_import_fails_halfway(self):
+        rows = [{'Category': 'CPU', 'Name': f'Core i{n}', 'Price': '300', 'Stock': '2'} for n in (3, 5)]
+        data = '\n'.join(json.dumps(row) for row in rows)
+        bulk_create, calls = Item.objects.bulk_create, []
+
+        def fail_on_second_batch(objs, *args, **kwargs):
+            calls.append(objs)
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return bulk_create(objs, *args, **kwargs)
+
+        version = catalog_version()
+        with mock.patch.object(Item.objects, 'bulk_create', fail_on_second_batch), self.assertRaises(RuntimeError):
+            import_items(io.StringIO(data), 'jsonl', self.manager, batch_size=1)
+        self.assertEqual(list(Item.objects.values_list('name', flat=True).order_by('id')), ['Ryzen', 'Core i3'])
+        self.cpu.refresh_from_db()
+        self.assertEqual((self.cpu.item_count, self.cpu.available_count), (2, 2))
+        self.assertNotEqual(catalog_version(), version)
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media_root = media_root.name
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.item = Item.objects.create(category=Category.objects.create(name='CPU'), created_by=manager, name='Ryzen', price=1, stock=1)
+
+    def png(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1000), 'red').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def assertThumbnails(self, name):
+        for size, max_side in THUMBNAIL_SIZES.items():
+            with default_storage.open(thumbnail_name(name, size)) as f:
+                thumbnail = Image.open(f)
+                self.assertEqual((thumbnail.format, max(thumbnail.size)), ('WEBP', max_side), size)
+
+    def test_uploads_get_every_size(self):
+        image = Images.objects.create(item=self.item, image=ContentFile(self.png(), 'ryzen.png'))
+        # Until the job has run the pages use the original
+        self.assertEqual((image.srcset, image.card_url), ('', image.image.url))
+
+        call_command('runworker', once=True, stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertTrue(image.has_thumbnails)
+        self.assertThumbnails(image.image.name)
+        self.assertEqual(image.card_url, default_storage.url(thumbnail_name(image.image.name, 'card')))
+        self.assertEqual(image.srcset.count('w, '), len(THUMBNAIL_SIZES) - 1)
+
+    def test_command_fills_in_older_uploads(self):
+        path = os.path.join(self.media_root, 'item_images', 'legacy.png') # from before the blob storage
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(self.png())
+        Images.objects.bulk_create([Images(item=self.item, image='item_images/legacy.png')])
+
+        call_command('generate_thumbnails', stdout=io.StringIO())
+        self.assertTrue(Images.objects.get().has_thumbnails)
+        self.assertThumbnails('item_images/legacy.png')
+
+
+class ImageMetadataTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        manager = get_user_model().objects.create_user(username='manager', is_inventoryManager=True)
+        self.item = Item.objects.create(category=Category.objects.create(name='CPU'), created_by=manager, name='Ryzen', price=1, stock=1)
+
+    def upload(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), 'red').save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue(), 'ryzen.png')
+
+    def test_recorded_at_upload_and_used_by_the_grids(self):
+        image = Images.objects.create(item=self.item, image=self.upload())
+        self.assertEqual((image.width, image.height, image.format), (640, 480, 'png'))
+        self.assertEqual(image.file_size, image.image.size)
+        self.assertTrue(image.placeholder.startswith('data:image/webp;base64,'))
+
+        response = self.client.get(reverse('item:browse'))
+        self.assertContains(response, 'width="640" height="480"')
+        self.assertContains(response, image.placeholder)
+
+    def test_command_fills_in_older_uploads(self):
+        image = Images.objects.create(item=self.item, image=self.upload())
+        Images.objects.filter(pk=image.pk).update(width=None, height=None, placeholder='')
+        call_command('capture_image_metadata', stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (640, 480))
+        self.assertNotEqual(image.placeholder, '')
@@ -0,0 +1,71 @@
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Every uploaded item image gets resized copies so the pages never ship the full resolution original.
+# The number is the longest side in pixels, the aspect ratio is kept.
+THUMBNAIL_SIZES = {
+    'cart': 120,
+    'card': 400,
+    'detail': 800,
+}
+THUMBNAIL_FORMAT = 'WEBP'
+THUMBNAIL_QUALITY = 80
+
+
+def thumbnail_name(image_name, size):
+    # item_images/cpu.jpg -> item_images/thumbs/card/cpu.webp
+    directory, filename = posixpath.split(image_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'thumbs', size, stem + '.webp')
+
+
+def generate_thumbnails(field_file):
+    # Writes every size in THUMBNAIL_SIZES next to the original, replacing older copies.
+    # Returns False if the original can't be read as an image.
+    storage = field_file.storage
+    try:
+        with field_file.open('rb') as f:
+            original = Image.open(f)
+            original.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning("Could not create thumbnails for %s", field_file.name, exc_info=True)
+        return False
+
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'A' in original.getbands() or original.mode == 'P' else 'RGB')
+
+    for size, max_side in THUMBNAIL_SIZES.items():
+        thumbnail = original.copy()
+        thumbnail.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = BytesIO()
+        thumbnail.save(buffer, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY, method=6)
+
+        name = thumbnail_name(field_file.name, size)
+        if storage.exists(name):
+            storage.delete(name) # otherwise the storage would save it under a new random suffix
+        storage.save(name, ContentFile(buffer.getvalue()))
+    return True
+
+
+def make_thumbnails(image_id):
+    # Background job (core/jobs.py) enqueued by Images.save() for every new upload
+    from .cache import bump_catalog_version, purge_item_pages
+    from .models import Images, Item
+
+    image = Images.objects.select_related('item').filter(pk=image_id).first()
+    if image is None or image.has_thumbnails or not image.image:
+        return # deleted meanwhile, or done already
+    if not generate_thumbnails(image.image):
+        return # not an image, the pages keep showing the original
+
+    Images.objects.filter(pk=image.pk).update(has_thumbnails=True)
+    Item.objects.filter(pk=image.item_id).update(updated_at=timezone.now()) # the pages now link the thumbnails
+    bump_catalog_version()
+    purge_item_pages([image.item_id], [image.item.category_id])
@@ -1,7 +1,7 @@
 # Clean and more organized way by making another urls.py in this '.item' folder
 
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'item' 
 
@@ -12,4 +12,8 @@ urlpatterns = [
     path('<int:pk>/delete/', views.delete, name='delete'), #for delete items path
     path('<int:pk>/edit/', views.edit, name='edit'), #for Edit items path
     path('export-csv/', views.export_items_to_csv, name='export_items_to_csv'),
+    path('import/', views.import_items_view, name='import_items'), # CSV/JSONL bulk import, see item/imports.py
+    path('api/items/', api.items, name='api_items'), # read-only JSON API, see item/api.py
+    path('api/categories/', api.categories, name='api_categories'),
+    path('suggest/', api.suggest, name='suggest'), # search-as-you-type, see item/suggest.py
 ]
\ No newline at end of file
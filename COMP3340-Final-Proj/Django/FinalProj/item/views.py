@@ -1,64 +1,126 @@
+import io
+
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
 from django.shortcuts import render, get_object_or_404, redirect
 
-from .forms import NewItemForm, EditItemForm, ImageForm
+from .cache import cache_timeout, catalog_cache_key
+from .conditional import browse_etag, browse_last_modified, detail_etag, detail_last_modified
+from .export import csv_chunks, gzip_chunks
+from .forms import NewItemForm, EditItemForm, ImageForm, ImportItemsForm
+from .imports import import_items
 from .models import Category, Item, Images
+from .pagination import CursorPaginator, page_query
+from .facets import browse_facets
+from .search import filter_items, filter_params, sort_ordering
 
-from django.core.paginator import Paginator
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
 
 from django.forms import modelformset_factory
 from django.template.loader import get_template
 
 from django.contrib.auth.decorators import user_passes_test
-import csv
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+from core.page_cache import tag_page
 
 def is_inventory_manager(user):
     return user.is_authenticated and user.is_inventoryManager
 
+# The AJAX requests answer 304 Not Modified when nothing matching the filters changed, see item/conditional.py
+@condition(etag_func=browse_etag, last_modified_func=browse_last_modified)
 def browse(request):
-    query = request.GET.get('query', '')
-    selected_categories = request.GET.getlist('category')
-    categories = Category.objects.all()
-    items = Item.objects.filter(is_sold=False)
+    query, selected_categories, price = filter_params(request.GET)
+    selected_categories = [pk for pk in selected_categories if pk.isdigit()] # the form only sends ids, skip the rest
+    ordering = sort_ordering(request.GET) # ?sort=price_asc/price_desc, newest (or best match) first otherwise
+    cursor = request.GET.get('cursor')
+    filters = page_query(request) # every parameter except the cursor, used in the cache keys
 
-    if selected_categories:
-        items = items.filter(category__in=selected_categories)
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
-    if query:
-        items = items.filter(Q(name__icontains=query) | Q(description__icontains=query))
+    # Anonymous visitors get the whole response from the page cache (core/page_cache.py) until one of these changes.
+    # Not only the selected categories: the facets count the items of every category.
+    tag_page(request, 'categories', 'items')
 
-    p = Paginator(items, 9)
-    page = request.GET.get('page')
-    items_list = p.get_page(page)
-    numPages = "a" * items_list.paginator.num_pages
+    # Popular filter combinations are answered straight from the cache, see item/cache.py
+    json_key = catalog_cache_key('browse_json', filters, cursor)
+    if is_ajax:
+        cached = cache.get(json_key)
+        if cached is not None:
+            return JsonResponse(cached)
+
+    items = Item.objects.filter(is_sold=False).prefetch_related('images') # one query for all the card images
+    items = filter_items(items, query, selected_categories, price)
+
+    # The page is only fetched when the template needs it, so a cached item_list fragment skips the query
+    p = CursorPaginator(items, 9, ordering=ordering)
+    items_list = p.get_page(cursor)
+
+    # Result counts per category, per price range and in stock, one cached aggregate (see item/facets.py)
+    facets = browse_facets(query, selected_categories, price)
+
+    context = {
+        'items': items_list,
+        'page_query': filters,
+        'fragment_key': catalog_cache_key('item_list', filters, cursor),
+        'cache_timeout': cache_timeout(),
+    }
 
-    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
-    
     if is_ajax:
         # If the request is AJAX, render only the content of the item_list template
         template = get_template('item/item_list.html')
-        html_content = template.render({'items': items_list})
-        print("AJAX request. Returning JSON response.")
-        return JsonResponse({'html_content': html_content, 'numPages': numPages})
+        html_content = template.render(context)
+        data = {
+            'html_content': html_content,
+            'next_cursor': items_list.next_cursor,
+            'previous_cursor': items_list.previous_cursor,
+            'facets': facets,
+        }
+        cache.set(json_key, data, cache_timeout())
+        return JsonResponse(data)
 
     # If it's not an AJAX request, render the HTML page
-    print("Non-AJAX request. Rendering HTML page.")
+    counts = {facet['id']: facet['count'] for facet in facets['categories']}
+
+    def sidebar_categories():
+        # Called by the template, so a cached sidebar doesn't query the categories at all
+        return [
+            {'id': category.id, 'name': category.name, 'count': counts.get(category.id, 0), 'selected': str(category.id) in selected_categories}
+            for category in Category.objects.all()
+        ]
+
+    price_links = []
+    for bucket in facets['price']:
+        params = request.GET.copy()
+        params.pop('cursor', None)
+        params['min_price'] = bucket['min']
+        if bucket['max'] is None:
+            params.pop('max_price', None)
+        else:
+            params['max_price'] = bucket['max']
+        price_links.append({**bucket, 'query': params.urlencode(), 'selected': price == (bucket['min'], bucket['max'])})
+
     return render(request, 'item/browse.html', {
-        'items': items_list,
-        'numPages': numPages,
+        **context,
         'query': query,
-        'categories': categories,
-        'selected_categories': selected_categories
+        'categories': sidebar_categories,
+        'categories_key': catalog_cache_key('browse_categories', selected_categories, query, price),
+        'selected_categories': selected_categories,
+        'facets': facets,
+        'price_links': price_links,
+        'min_price': request.GET.get('min_price', ''),
+        'max_price': request.GET.get('max_price', ''),
+        'sort': request.GET.get('sort', ''),
+        'sorts': [('newest', 'Newest'), ('price_asc', 'Price: low to high'), ('price_desc', 'Price: high to low')],
     })
 
 # This view is for creating the details page for the item
+@condition(etag_func=detail_etag, last_modified_func=detail_last_modified) # 304 for repeat visits, see item/conditional.py
 def detail(request, pk): #pk stands for primary key
-    item = get_object_or_404(Item, pk=pk) #Get the object, or get 404 error
-    related_items = Item.objects.filter(category=item.category, is_sold=False).exclude(pk=pk)[0:3] #this is for displaying related items in the same category
-    images = item.images.all()  # Retrieve all images associated with the item
+    item = get_object_or_404(Item.objects.select_related('created_by').prefetch_related('images'), pk=pk) #Get the object, or get 404 error
+    related_items = Item.objects.filter(category_id=item.category_id, is_sold=False).exclude(pk=pk).prefetch_related('images')[0:3] #this is for displaying related items in the same category
+    tag_page(request, f'item:{pk}', f'category:{item.category_id}')
 
     return render(request, 'item/detail.html', {
         'item': item,
@@ -115,7 +177,10 @@ def edit(request, pk):
         formset = ImageFormSet(request.POST, request.FILES, queryset=Images.objects.filter(item=item))
 
         if form.is_valid() and formset.is_valid():
-            form.save()
+            # Only write the fields that were changed, so an edit doesn't overwrite stock sold in the meantime
+            item = form.save(commit=False)
+            if form.changed_data:
+                item.save(update_fields=form.changed_data)
 
             # Save only the last two forms in the formset
             for form_instance in formset[::-1][:2]:
@@ -151,31 +216,41 @@ def delete(request, pk):
         return redirect('item:browse')
     
 def export_items_to_csv(request):
-    # Get all items and related data
-    items = Item.objects.all()
+    # Takes the same query/category/price parameters as browse, add ?gzip=1 for a compressed file
+    items = filter_items(Item.objects.all(), *filter_params(request.GET))
+
+    # The rows are streamed to the client as they are read from the database,
+    # so the export uses the same memory for 10 items or 100k items
+    chunks = csv_chunks(items)
+    filename = 'items_export.csv'
+    if request.GET.get('gzip'):
+        response = StreamingHttpResponse(gzip_chunks(chunks), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
 
-    # Create response object with appropriate CSV headers
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="items_export.csv"'
+    return response
 
-    # Create a CSV writer object
-    writer = csv.writer(response)
-    
-    # Write CSV headers
-    writer.writerow(['ID', 'Category', 'Name', 'Description', 'Price', 'Is Sold', 'Stock', 'Created By', 'Created At'])
-
-    # Write data rows
-    for item in items:
-        writer.writerow([
-            item.id,
-            item.category.name,
-            item.name,
-            item.description,
-            item.price,
-            item.is_sold,
-            item.stock,
-            item.created_by.username,
-            item.created_at
-        ])
-
-    return response
\ No newline at end of file
+
+# Bulk import, the other direction of the export (see item/imports.py)
+@user_passes_test(is_inventory_manager)
+def import_items_view(request):
+    result = None
+    if request.method == 'POST':
+        form = ImportItemsForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            format = 'jsonl' if upload.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+            result = import_items(
+                io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''), format, request.user,
+                create_categories=form.cleaned_data['create_categories'], dry_run=form.cleaned_data['dry_run'],
+            )
+    else:
+        form = ImportItemsForm()
+
+    return render(request, 'item/import.html', {
+        'form': form,
+        'result': result,
+        'title': 'Import Items',
+    })